@@ -41,14 +41,28 @@ const METHODS = {
       command = template.replace("?", JSON.stringify(message));
     }
 
-    sendCommand(tab, command);
+    // Modo streaming: el host pidió trozos parciales de esta respuesta
+    const sink = typeof this.onChunk === "function" ? this.onChunk : null;
+    if (sink) streamSinks.set(tab.id, sink);
+
+    // Id de la petición del host: la respuesta de la pestaña va solo a este resolver
+    const requestId = this.requestId ?? Symbol("send");
+    if (!pendingResponses.has(tab.id)) pendingResponses.set(tab.id, new Map());
+    const waiters = pendingResponses.get(tab.id);
 
     const body = await new Promise((resolve, reject) => {
-      const timeout = setTimeout(() => reject(new Error("Timeout esperando respuesta")), 900_000); // 15 min
-      pendingResponses.push((data) => {
+      const timeout = setTimeout(() => {
+        waiters.delete(requestId);
+        if (!waiters.size && pendingResponses.get(tab.id) === waiters) pendingResponses.delete(tab.id);
+        reject(new Error("Timeout esperando respuesta"));
+      }, 900_000); // 15 min (EXTENSION_TIMEOUT en host.py)
+      waiters.set(requestId, (data) => {
         clearTimeout(timeout);
         resolve(data);
       });
+      sendCommand(tab, command);
+    }).finally(() => {
+      if (sink && streamSinks.get(tab.id) === sink) streamSinks.delete(tab.id);
     });
     return { ok: true, ts: Date.now(), body };
   }
@@ -56,10 +70,11 @@ const METHODS = {
 
 
 // === 2) Ejecuta método por nombre de forma segura
-async function runMethodByName(name, args = []) {
+// ctx se expone como `this` (hereda de globalThis, así this.botSetting sigue funcionando)
+async function runMethodByName(name, args = [], ctx = {}) {
   const fn = METHODS[name];
   if (!fn) throw new Error(`Método no encontrado: ${name}`);
-  return await fn(...args);
+  return await fn.apply(Object.assign(Object.create(globalThis), ctx), args);
 }
 
 // === 3) (Opcional) Ejecutar en página activa si lo necesitas
@@ -85,7 +100,11 @@ function connectNative() {
   nativePort.onMessage.addListener(async (msg) => {
     try {
       if (msg?.type === "RUN") {
-        const res = await runMethodByName(msg.name, msg.args || []);
+        // requestId: para que la respuesta de la pestaña llegue solo a esta petición
+        // stream: reenviar texto parcial al host como { id, type: "CHUNK", delta }
+        const ctx = { requestId: msg.id };
+        if (msg.stream) ctx.onChunk = (delta) => nativePort.postMessage({ id: msg.id, type: "CHUNK", delta });
+        const res = await runMethodByName(msg.name, msg.args || [], ctx);
         nativePort.postMessage({ id: msg.id, ok: true, res });
       } else if (msg?.type === "RUN_IN_PAGE") {
         const res = await runInActiveTab(msg.funcSource, msg.args || []);
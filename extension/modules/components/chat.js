@@ -1,4 +1,16 @@
-const pendingResponses = [];
+// tabId -> Map(id de la petición del host -> resolver), en orden de envío.
+// El host garantiza una sola petición en vuelo por pestaña; cada respuesta SSE se
+// entrega solo a la petición a la que quedó asociada (boundResponses), nunca a todas.
+const pendingResponses = new Map();
+// requestId (CDP) -> { tabId, id }: a qué petición del host pertenece cada SSE, fijado
+// cuando empieza la respuesta. Si esa petición ya expiró (timeout), la respuesta tardía
+// se descarta en vez de resolver la siguiente petición de la pestaña.
+const boundResponses = new Map();
+
+// tabId -> callback(delta) para peticiones en modo streaming
+const streamSinks = new Map();
+// requestId (CDP) -> estado del stream SSE que se está reenviando
+const liveStreams = new Map();
 
 async function init() {
   setBotSetting();
@@ -49,17 +61,89 @@ async function addDebugListener() {
 
 function onNetwork(source, method, params) {
   const { requestId } = params;
+  if (method === 'Network.responseReceived') {
+    bindResponse(source, params);
+    onStreamStart(source, params);
+    return;
+  }
+  if (method === 'Network.dataReceived') {
+    onStreamData(requestId, params.data);
+    return;
+  }
+  if (method === 'Network.loadingFinished' || method === 'Network.loadingFailed') {
+    liveStreams.delete(requestId);
+  }
+  const bound = boundResponses.get(requestId);
+  if (method === 'Network.loadingFailed') boundResponses.delete(requestId);
   if (requestId >= 0 && method === 'Network.loadingFinished') {
+    boundResponses.delete(requestId);
     chrome.debugger.sendCommand(source, 'Network.getResponseBody', { requestId }, (result) => {
       if (typeof result?.body === 'string' && result.body.startsWith('event')) {
+        const waiters = pendingResponses.get(source.tabId);
+        if (!waiters?.size) return;
+        // Respuesta de una petición que ya expiró: no es de la que está esperando ahora
+        if (bound && !waiters.has(bound.id)) return;
         const resp = parseSSE(result.body.replaceAll('finished_successfully', ''));
-         for (const r of pendingResponses) r(resp?.message.replace(/```[\w-]*\n([\s\S]*?)\n```/g, '$1'));
-        pendingResponses.length = 0;
+        const text = resp?.message.replace(/```[\w-]*\n([\s\S]*?)\n```/g, '$1');
+        const [id, resolve] = bound ? [bound.id, waiters.get(bound.id)] : waiters.entries().next().value;
+        waiters.delete(id);
+        if (!waiters.size) pendingResponses.delete(source.tabId);
+        resolve(text);
       }
     });
   }
 }
 
+// Asocia una respuesta SSE que empieza con la petición más antigua de la pestaña que
+// aún no tiene respuesta asignada.
+function bindResponse(source, params) {
+  const waiters = pendingResponses.get(source.tabId);
+  const mime = params.response?.mimeType || '';
+  if (!waiters?.size || !mime.includes('event-stream')) return;
+  const taken = new Set();
+  for (const b of boundResponses.values()) {
+    if (b.tabId === source.tabId) taken.add(b.id);
+  }
+  for (const id of waiters.keys()) {
+    if (!taken.has(id)) {
+      boundResponses.set(params.requestId, { tabId: source.tabId, id });
+      return;
+    }
+  }
+}
+
+// Si la pestaña tiene una petición en modo streaming, pide a CDP los datos del SSE
+// a medida que llegan (Network.streamResourceContent) en vez de esperar al final.
+function onStreamStart(source, params) {
+  const sink = streamSinks.get(source.tabId);
+  const mime = params.response?.mimeType || '';
+  if (!sink || !mime.includes('event-stream')) return;
+
+  const state = { sink, raw: '', sent: 0, decoder: new TextDecoder() };
+  liveStreams.set(params.requestId, state);
+  chrome.debugger.sendCommand(source, 'Network.streamResourceContent', { requestId: params.requestId }, (result) => {
+    if (result?.bufferedData) onStreamData(params.requestId, result.bufferedData);
+  });
+}
+
+// Reconstruye el mensaje con parseSSE y reenvía solo el texto nuevo.
+// Es una vista previa: la respuesta final (loadingFinished) sigue siendo la autoritativa.
+function onStreamData(requestId, b64) {
+  const state = liveStreams.get(requestId);
+  if (!state || !b64) return;
+  const bytes = Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+  const text = state.decoder.decode(bytes, { stream: true });
+  state.raw += text;
+  // Solo re-parsear al cerrar una línea SSE
+  if (!text.includes('\n')) return;
+  const message = parseSSE(state.raw.replaceAll('finished_successfully', '')).message || '';
+  if (message.length > state.sent) {
+    const delta = message.slice(state.sent);
+    state.sent = message.length;
+    state.sink(delta);
+  }
+}
+
 async function sendCommand(tab, command) {
   await chrome.debugger.sendCommand(
     { tabId: tab.id },
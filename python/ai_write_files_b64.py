@@ -6,29 +6,90 @@ from __future__ import annotations
 import argparse
 import base64
 import binascii
+import codecs
 import gzip
+import hashlib
+import io
+import json
 import os
 import re
+import shutil
+import stat
 import sys
 import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 
-FENCE_RE = re.compile(
-    r"```(?P<lang>[a-zA-Z0-9_+-]*)[ \t]*\n(?P<body>.*?)(?:\n```[ \t]*\n?|```[ \t]*$)",
-    re.DOTALL,
-)
+# Parser de headers "file:" y fences ``` (una sola pasada, sin regex con backtracking).
+# Reconoce exactamente lo mismo que las regex que usaba antes este script:
+#   FENCE_RE:       ```(?P<lang>[a-zA-Z0-9_+-]*)[ \t]*\n(?P<body>.*?)(?:\n```[ \t]*\n?|```[ \t]*$)  (DOTALL)
+#   FILE_HEADER_RE: (?im)^(?:\s*(?:#+\s*)?)?(?:file|archivo)\s*:\s*(?P<path>.+?)\s*$
+# (bench_b64_parser.py las conserva para comparar). Las regex de aquí abajo no
+# retroceden: son rachas de una clase de caracteres o partes que no se solapan.
+WS_RUN_RE = re.compile(r"\s*")
+TAIL_RUN_RE = re.compile(r"[\s#]*")
+# Apertura de fence: sin ambigüedad entre las partes, así que tampoco retrocede
+FENCE_OPEN_RE = re.compile(r"```([a-zA-Z0-9_+-]*)[ \t]*\n")
+BLANK_RUN_RE = re.compile(r"[ \t]*")
+# Lo mismo que (?i)file|archivo: para la i, (?i) acepta también las del turco
+HEADER_WORD_RE = re.compile(r"[fF][iIİı][lL][eE]|[aA][rR][cC][hH][iIİı][vV][oO]")
+# Palabra + ":" (empezar por una clase de caracteres hace la búsqueda mucho más rápida).
+# El grupo opcional es el caso común ya resuelto: ruta en la misma línea y contenido justo
+# debajo; así muchas secciones pequeñas seguidas no pasan por la máquina de estados.
+HEADER_CANDIDATE_RE = re.compile(r"[fFaA](?i:ile|rchivo)\s*:(?:[^\S\n]*(\S[^\n]*)\n(?=\S))?")
+# Tras el ":": ruta en la misma línea (el caso común; si no, paso a paso)
+PATH_LINE_RE = re.compile(r"[^\S\n]*(\S[^\n]*)")
 
-FILE_HEADER_RE = re.compile(
-    r"(?im)^(?:\s*(?:#+\s*)?)?(?:file|archivo)\s*:\s*(?P<path>.+?)\s*$"
-)
+# Modo --stream: tamaño de cada lectura de la entrada base64
+STREAM_CHUNK = 1024 * 1024
+# Texto previo al primer "file:" que se guarda en memoria antes de pasar a disco
+PREAMBLE_SPOOL_BYTES = 8 * 1024 * 1024
+B64_JUNK_RE = re.compile(rb"[^A-Za-z0-9+/=]")
+URLSAFE_TO_STD = bytes.maketrans(b"-_", b"+/")
+URLSAFE_TO_STD_STR = str.maketrans("-_", "+/")
+# Hilos para escribir los temporales del modo multi-archivo (--jobs)
+WRITE_JOBS = min(8, (os.cpu_count() or 1) * 2)
+# --manifest: caché de hashes por outdir para --skip-unchanged. Por defecto va junto
+# al outdir (.<outdir>.ai_write_manifest.json), no dentro: un bundle no puede pisarla.
+MANIFEST_NAME = ".ai_write_manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK = 1024 * 1024
+# Tope por os.write() al escribir los temporales
+WRITE_CHUNK = 8 * 1024 * 1024
+# "file: x.png; encoding=base64": la sección se decodifica a bytes en vez de ir como texto
+ENCODING_PARAM_RE = re.compile(r"\s*encoding\s*=\s*([A-Za-z0-9_-]+)\s*", re.IGNORECASE)
+# Un mtime así de reciente no se guarda en el manifest (resolución de 1s en algunos FS)
+FRESH_GUARD_SECONDS = 2.0
 
 @dataclass
 class CodeBlock:
+    """Fence encontrado; el cuerpo es text[body_start:body_end] (no se copia)."""
     lang: str
-    body: str
+    start: int
+    end: int
+    body_start: int
+    body_end: int
+    size: int  # largo del cuerpo ya normalizado (\r\n -> \n)
+
+
+@dataclass
+class FileHeader:
+    path: str
+    start: int  # puede empezar en líneas en blanco anteriores (como la regex)
+    end: int    # el "\n" que cierra el header, o el final del texto
+
+
+@dataclass
+class FileSection:
+    """Sección "file:"; el contenido es source[start:end], ya sin "\\n" en los bordes."""
+    path: str
+    source: str
     start: int
     end: int
 
@@ -63,7 +124,12 @@ def read_b64_input(b64_arg: Optional[str], input_file: Optional[str]) -> str:
             # Si falla, lo dejamos como está
             pass
 
-    return raw.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+    return normalize_newlines(raw.decode("utf-8", errors="replace"))
+
+
+def normalize_newlines(text: str) -> str:
+    """CRLF/CR -> LF, una sola vez antes de buscar headers y fences."""
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
 
 
 def b64_decode_flexible(s: str) -> bytes:
@@ -86,13 +152,478 @@ def b64_decode_flexible(s: str) -> bytes:
         raise ValueError(f"Base64 inválido: {e}") from e
 
 
-def find_code_blocks(text: str) -> List[CodeBlock]:
-    blocks: List[CodeBlock] = []
-    for m in FENCE_RE.finditer(text):
-        lang = (m.group("lang") or "").strip().lower()
-        body = m.group("body").replace("\r\n", "\n").replace("\r", "\n")
-        blocks.append(CodeBlock(lang=lang, body=body, start=m.start(), end=m.end()))
-    return blocks
+# -----------------------------
+# MODO STREAMING (--stream)
+# -----------------------------
+def open_b64_source(b64_arg: Optional[str], input_file: Optional[str]) -> BinaryIO:
+    """Misma prioridad que read_b64_input, pero devuelve un stream binario."""
+    if input_file:
+        return open(input_file, "rb")
+    if b64_arg is not None:
+        return io.BytesIO(b64_arg.encode("ascii", errors="ignore"))
+    return sys.stdin.buffer
+
+
+def iter_b64_decoded(source: BinaryIO, chunk_size: int = STREAM_CHUNK) -> Iterator[bytes]:
+    """
+    Decodifica base64 (estándar o urlsafe) por trozos. `-`/`_` se traducen a `+`/`/`
+    (el alfabeto estándar no los usa, así que es lo mismo que detectar urlsafe), se
+    descarta todo lo que no sea del alfabeto y se decodifica en grupos de 4 caracteres;
+    el resto se guarda para el siguiente trozo. El padding faltante se completa al final.
+    """
+    rest = b""
+    seen = False
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        chunk = B64_JUNK_RE.sub(b"", chunk.translate(URLSAFE_TO_STD))
+        if not chunk:
+            continue
+        seen = True
+        data = rest + chunk
+        cut = len(data) - len(data) % 4
+        rest = data[cut:]
+        if cut:
+            try:
+                yield base64.b64decode(data[:cut])
+            except (binascii.Error, ValueError) as e:
+                raise ValueError(f"Base64 inválido: {e}") from e
+    if not seen:
+        raise ValueError("Entrada base64 vacía.")
+    if rest:
+        try:
+            yield base64.b64decode(rest + b"=" * ((-len(rest)) % 4))
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"Base64 inválido: {e}") from e
+
+
+def iter_gunzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Si el contenido empieza como gzip, lo descomprime de forma incremental (también
+    varios miembros gzip seguidos, como gzip.decompress). Si no, lo deja pasar igual.
+    """
+    it = iter(chunks)
+    head = b""
+    for chunk in it:
+        head += chunk
+        if len(head) >= 2:
+            break
+    if not head.startswith(b"\x1f\x8b"):
+        if head:
+            yield head
+        yield from it
+        return
+
+    def members():
+        yield head
+        yield from it
+
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    produced = False
+    consumed: List[bytes] = []  # lo leído antes de la primera salida, por si no es gzip
+    try:
+        for chunk in members():
+            if not produced:
+                consumed.append(chunk)
+            while chunk:
+                # Salida acotada por llamada: un trozo muy comprimible no se expande entero
+                out = d.decompress(chunk, STREAM_CHUNK)
+                if out:
+                    produced = True
+                    consumed = []
+                    yield out
+                if d.unconsumed_tail:
+                    chunk = d.unconsumed_tail
+                    continue
+                if not d.eof:
+                    break
+                # Fin de un miembro: lo que sobra puede ser otro gzip
+                chunk = d.unused_data
+                d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        tail = d.flush()
+        if tail:
+            yield tail
+    except zlib.error as e:
+        if produced:
+            raise ValueError(f"gzip inválido: {e}") from e
+        # Igual que el modo normal: si ni siquiera arranca, se usa tal cual
+        yield from consumed
+        yield from it
+
+
+def iter_text(chunks: Iterable[bytes]) -> Iterator[str]:
+    """UTF-8 incremental (con reemplazo en errores) y CRLF/CR -> LF sin partir un \\r\\n."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending_cr = False
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if not text:
+            continue
+        if pending_cr:
+            text = "\r" + text
+        pending_cr = text.endswith("\r")
+        if pending_cr:
+            text = text[:-1]
+        yield normalize_newlines(text)
+    text = decoder.decode(b"", final=True)
+    if pending_cr:
+        text = "\r" + text
+    if text:
+        yield normalize_newlines(text)
+
+
+def iter_decoded_text(b64_arg: Optional[str], input_file: Optional[str]) -> Iterator[str]:
+    source = open_b64_source(b64_arg, input_file)
+    try:
+        yield from iter_text(iter_gunzip(iter_b64_decoded(source)))
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+
+
+class HeaderScanner:
+    """
+    Reconoce los headers "file: ruta" igual que la regex anterior, en una pasada.
+    En vez de probar cada comienzo de línea (la regex volvía a recorrer cada racha de
+    líneas en blanco desde cada línea), busca "file"/"archivo" seguido de ":" y mira
+    hacia atrás si lo que precede a la palabra desde algún comienzo de línea es solo
+    espacios y "#"; después sigue hacia delante hasta la ruta.
+
+    Se puede alimentar por partes: scan(text, final=False) devuelve los headers ya
+    decididos y se queda esperando si el texto acaba a mitad de uno. Las posiciones
+    son relativas a `text`; si quien llama descarta el principio, debe avisar con
+    shift(n). keep_from() dice desde dónde hay que conservarlo.
+    """
+
+    SEARCH, COLON, PATH_START, PATH, TAIL = range(5)
+
+    def __init__(self):
+        self.state = self.SEARCH
+        self.lo = 0     # ningún header puede empezar antes de aquí
+        self.pos = 0    # cursor
+        self.word = 0   # dónde empieza "file"/"archivo"
+        self.start = 0  # comienzo del header en curso
+        self.mark = 0   # comienzo de la ruta
+        self.path_end = 0
+        self.seen = 0   # hasta dónde se miró la racha final en la llamada anterior
+        self.tail = 0   # comienzo de la racha final de espacios/"#" (posible header)
+        self.bol = True  # si la posición 0 de `text` es comienzo de línea
+
+    def keep_from(self) -> int:
+        return self.start if self.state != self.SEARCH else max(self.lo, self.tail)
+
+    def shift(self, n: int, bol: bool) -> None:
+        """Se descartaron n caracteres; bol: si el último era "\\n"."""
+        for name in ("lo", "pos", "word", "start", "mark", "path_end", "seen", "tail"):
+            setattr(self, name, max(getattr(self, name) - n, 0))
+        self.bol = bol
+
+    def scan(self, text: str, final: bool = True) -> List[FileHeader]:
+        out: List[FileHeader] = []
+        n = len(text)
+        pos = self.pos
+        while True:
+            if self.state != self.SEARCH:
+                pos = self._forward(text, pos, final, out)
+                if self.state != self.SEARCH:
+                    break  # a mitad de un header: falta texto
+            m = HEADER_CANDIDATE_RE.search(text, pos)
+            while m is not None:
+                word = m.start()
+                # [fFaA](?i:ile|rchivo) también acepta "aile"/"frchivo": se descartan aquí
+                if (text[word] in "fF") == (text[word + 1] in "iIİı"):
+                    break
+                m = HEADER_CANDIDATE_RE.search(text, word + 1)
+            if m is None:
+                if final:
+                    self.lo = self.tail = pos = n
+                else:
+                    pos = self._wait(text, pos)
+                break
+            # Lo habitual: la palabra abre una línea que sigue a otra con texto (fin "\n"
+            # o "\r\n"), así que no hay un comienzo anterior posible; si no, _header_start
+            b = word - 2
+            if b >= self.lo and text[b + 1] == "\n":
+                if text[b] == "\r" and b > self.lo:
+                    b -= 1
+                c = text[b]
+                start = word if not (c.isspace() or c == "#") else self._header_start(text, word)
+            else:
+                start = self._header_start(text, word)
+            if start < 0:
+                self.lo = pos = word + 1
+                continue
+            path = m.group(1)
+            if path is not None:
+                # Lo mismo que haría _forward: el header acaba en el "\n" tras la ruta
+                pos = m.end()
+                out.append(FileHeader(path.rstrip(), start, pos - 1))
+                self.lo = self.tail = pos
+                if self.seen < pos:
+                    self.seen = pos
+                continue
+            self.word, self.start = word, start
+            self.state = self.PATH_START
+            pos = self.mark = m.end()
+        self.pos = pos
+        return out
+
+    def _wait(self, text: str, pos: int) -> int:
+        """Sin candidato en lo recibido: desde dónde seguir cuando llegue más texto."""
+        n = len(text)
+        cut = max(self.lo, n - 7)  # la palabra puede llegar partida (o sin el ":")
+        self._update_tail(text, cut)
+        # "file" + espacios hasta el final: se espera el ":" sin volver a recorrerlos
+        ws_start = pos + len(text[pos:n].rstrip())
+        if ws_start < n:
+            for size in (4, 7):
+                word = ws_start - size
+                if word >= pos and HEADER_WORD_RE.fullmatch(text, word, ws_start):
+                    start = self._header_start(text, word)
+                    if start >= 0:
+                        self.word, self.start, self.state = word, start, self.COLON
+                        return n
+        return cut
+
+    def _header_start(self, text: str, k: int) -> int:
+        """Primer comienzo de línea >= lo desde el que se llega a k con \\s*(#+\\s*)?, o -1."""
+        lo = self.lo
+        if k > lo and not (text[k - 1].isspace() or text[k - 1] == "#"):
+            return -1
+        # rstrip() quita lo mismo que \s: así se va hacia atrás sin bucle en Python
+        j = lo + len(text[lo:k].rstrip())
+        if j > lo and text[j - 1] == "#":
+            h = lo + len(text[lo:j].rstrip("#"))
+            start = self._line_start_in(text, lo + len(text[lo:h].rstrip()), h)
+            if start >= 0:
+                return start
+        return self._line_start_in(text, j, k)
+
+    def _line_start_in(self, text: str, a: int, b: int) -> int:
+        """Primer comienzo de línea en [a, b], o -1."""
+        if (text[a - 1] == "\n") if a else self.bol:
+            return a
+        nl = text.find("\n", a, b)
+        return nl + 1 if nl >= 0 else -1
+
+    def _forward(self, text: str, pos: int, final: bool, out: List[FileHeader]) -> int:
+        """
+        Tras la palabra clave: \\s* ":" \\s* ruta \\s* fin de línea. Deja self.state en
+        SEARCH si ya se decidió (header en `out` o descartado) o en el paso que espera texto.
+        """
+        n = len(text)
+        state = self.state
+        if state == self.COLON:
+            pos = WS_RUN_RE.match(text, pos).end()
+            if pos == n and not final:
+                return pos
+            if pos == n or text[pos] != ":":
+                self.state = self.SEARCH
+                self.lo = self.word + 1
+                return self.lo
+            self.mark = pos = pos + 1
+            state = self.PATH_START
+        if state == self.PATH_START:
+            m = PATH_LINE_RE.match(text, pos)
+            if m is not None and m.end() < n:
+                # Lo habitual: la ruta en la misma línea que el ":"
+                self.mark = m.start(1)
+                pos = m.end()
+                self.path_end = self.mark + len(text[self.mark:pos].rstrip())
+                state = self.TAIL
+            else:
+                pos = WS_RUN_RE.match(text, pos).end()
+                if pos == n:
+                    if not final:
+                        self.state = state
+                        return pos
+                    # Solo espacios hasta el final: la regex toma como ruta el último
+                    # carácter que no sea "\n" (o no hay header)
+                    last = self.mark + len(text[self.mark:n].rstrip("\n")) - 1
+                    if last >= self.mark:
+                        out.append(FileHeader(text[last], self.start, n))
+                    self.state = self.SEARCH
+                    self.lo = n
+                    return n
+                self.mark = pos
+                state = self.PATH
+        if state == self.PATH:
+            eol = text.find("\n", pos)
+            if eol < 0:
+                if not final:
+                    self.state = state
+                    return n
+                eol = n
+            self.path_end = self.mark + len(text[self.mark:eol].rstrip())
+            pos = eol
+            state = self.TAIL
+        # TAIL: el header se come los espacios/líneas en blanco hasta el último "\n"
+        if pos + 1 < n and text[pos] == "\n" and not text[pos + 1].isspace():
+            end = pos  # sin líneas en blanco detrás
+        else:
+            pos = WS_RUN_RE.match(text, pos).end()
+            if pos == n and not final:
+                self.state = state
+                return pos
+            end = n if pos == n else text.rfind("\n", self.path_end, pos)
+        out.append(FileHeader(text[self.mark:self.path_end], self.start, end))
+        self.state = self.SEARCH
+        # el siguiente puede empezar justo en ese "\n" si la línea anterior está vacía
+        self.lo = end if end == n or text[end - 1] == "\n" else end + 1
+        self.seen = max(self.seen, self.lo)
+        self.tail = self.lo
+        return self.lo
+
+    def _update_tail(self, text: str, cut: int) -> None:
+        # Solo se mira el texto nuevo: una racha larga no se recorre en cada llamada
+        new = max(self.seen, self.lo)
+        if new < cut:
+            run = TAIL_RUN_RE.match(text[new:cut][::-1]).end()
+            if run < cut - new:
+                self.tail = cut - run
+            self.seen = cut
+
+
+def strip_newlines(text: str, start: int, end: int) -> Tuple[int, int]:
+    """Como text[start:end].strip("\\n"), pero devolviendo los límites."""
+    while start < end and text[start] == "\n":
+        start += 1
+    while end > start and text[end - 1] == "\n":
+        end -= 1
+    return start, end
+
+
+class SectionSplitter:
+    """
+    Recibe el texto por trozos y entrega cada sección "file:" en cuanto se completa
+    (al ver el siguiente header o al final). En memoria solo queda la sección en curso;
+    el texto antes del primer header va a un SpooledTemporaryFile, por si no hay ninguno.
+    Con spool=False (texto completo de una vez) no se guarda el preámbulo.
+
+    En el buffer solo queda lo que el scanner aún puede necesitar; lo anterior de la
+    sección en curso se guarda aparte en trozos (juntarlos en cada feed() sería
+    cuadrático en secciones grandes). Si la sección cabe en el buffer, no se copia.
+    """
+
+    def __init__(self, spool: bool = True):
+        self._buf = ""
+        self._scanner = HeaderScanner()
+        self._path: Optional[str] = None
+        self._body = 0
+        self._parts: List[str] = []  # principio de la sección en curso, ya fuera del buffer
+        self.preamble = (
+            tempfile.SpooledTemporaryFile(max_size=PREAMBLE_SPOOL_BYTES, mode="w+", encoding="utf-8", newline="")
+            if spool else None
+        )
+        self.headers = 0
+
+    def feed(self, text: str, final: bool = False) -> List[FileSection]:
+        """final=True: es el último trozo (como feed + close, sin copiar el texto)."""
+        self._buf = self._buf + text if self._buf else text
+        if final:
+            return self.close()
+        return self._run(final=False)
+
+    def close(self) -> List[FileSection]:
+        out = self._run(final=True)
+        if self._path is not None:
+            out.append(self._section(len(self._buf)))
+            self._path = None
+        return out
+
+    def _run(self, final: bool) -> List[FileSection]:
+        out: List[FileSection] = []
+        for h in self._scanner.scan(self._buf, final):
+            if self._path is not None:
+                out.append(self._section(h.start))
+            elif not self.headers and self.preamble is not None:
+                self.preamble.close()  # hay headers: el texto previo no se usa
+                self.preamble = None
+            self._path = h.path.strip()
+            self._body = h.end
+            self.headers += 1
+        keep = self._scanner.keep_from()
+        if self._path is None:
+            if self.preamble is not None and keep:
+                self.preamble.write(self._buf[:keep])
+        elif final:
+            return out  # close() entrega la última sección
+        else:
+            if keep > self._body:
+                self._parts.append(self._buf[self._body:keep])
+            self._body = max(self._body - keep, 0)
+        if keep:
+            self._scanner.shift(keep, self._buf[keep - 1] == "\n")
+            self._buf = self._buf[keep:]
+        return out
+
+    def _section(self, end: int) -> FileSection:
+        if self._parts:
+            source = "".join(self._parts) + self._buf[self._body:end]
+            self._parts = []
+            start, end = strip_newlines(source, 0, len(source))
+            return FileSection(self._path, source, start, end)
+        start, end = strip_newlines(self._buf, self._body, end)
+        return FileSection(self._path, self._buf, start, end)
+
+    def preamble_text(self) -> str:
+        self.preamble.seek(0)
+        return self.preamble.read()
+
+
+def iter_code_blocks(text: str, start: int = 0, end: Optional[int] = None) -> Iterator[CodeBlock]:
+    """
+    Fences ``` de text[start:end], en orden y sin solaparse. Se busca el siguiente
+    "\\n```" una sola vez (no desde cada apertura), así un fence sin cerrar no obliga
+    a recorrer el resto del texto otra vez por cada ``` que venga detrás.
+    """
+    if end is None:
+        end = len(text)
+    # Cierre "```[ \t]*$" al final del rango: como mucho una posición posible
+    tail_end = end - 1 if end > start and text[end - 1] == "\n" else end
+    t = tail_end
+    while t > start and text[t - 1] in " \t":
+        t -= 1
+    tail = t - 3 if t - 3 >= start and text.startswith("```", t - 3, t) else -1
+    close = -2  # última "\n```" encontrada (-1: no hay más)
+    i = start
+    while True:
+        m = FENCE_OPEN_RE.search(text, i, end)
+        if m is None:
+            return
+        o, body_start = m.start(), m.end()
+        if close != -1 and close < body_start:
+            close = text.find("\n```", body_start, end)
+        if close < 0 and tail < body_start:
+            return  # ninguna apertura posterior puede cerrarse
+        if close >= 0 and (tail < body_start or close < tail):
+            body_end = close
+            stop = BLANK_RUN_RE.match(text, close + 4, end).end()
+            if stop < end and text[stop] == "\n":
+                stop += 1
+        else:
+            body_end, stop = tail, tail_end
+        size = body_end - body_start
+        if text.find("\r", body_start, body_end) >= 0:
+            size -= text.count("\r\n", body_start, body_end)
+        yield CodeBlock(m.group(1).lower(), o, stop, body_start, body_end, size)
+        i = stop
+
+
+def block_body(text: str, block: CodeBlock) -> str:
+    return body_text(text, block.body_start, block.body_end)
+
+
+def body_text(text: str, start: int, end: int) -> str:
+    body = text[start:end]
+    if "\r" in body:
+        body = body.replace("\r\n", "\n").replace("\r", "\n")
+    return body
+
+
+def find_code_blocks(text: str, start: int = 0, end: Optional[int] = None) -> List[CodeBlock]:
+    return list(iter_code_blocks(text, start, end))
 
 
 def choose_best_block(blocks: List[CodeBlock], lang: Optional[str]) -> Optional[CodeBlock]:
@@ -113,29 +644,58 @@ def choose_best_block(blocks: List[CodeBlock], lang: Optional[str]) -> Optional[
             b_lang = aliases.get(b.lang, b.lang)
             if b_lang == target:
                 return b
-    return max(blocks, key=lambda b: len(b.body))
+    return max(blocks, key=lambda b: b.size)
 
 
-def strip_md_wrappers(text: str, prefer_lang: Optional[str]) -> str:
-    blocks = find_code_blocks(text)
-    if not blocks:
-        return text
-    chosen = choose_best_block(blocks, prefer_lang)
-    return chosen.body if chosen else text
+def strip_md_wrappers(text: str, prefer_lang: Optional[str], start: int = 0, end: Optional[int] = None) -> str:
+    """Cuerpo del fence elegido de text[start:end]; si no hay fences, el texto tal cual."""
+    if end is None:
+        end = len(text)
+    # Lo habitual: ningún fence, o uno solo (nada de ``` después de su cierre)
+    m = FENCE_OPEN_RE.search(text, start, end)
+    if m is None:
+        return text if start == 0 and end == len(text) else text[start:end]
+    close = text.find("\n```", m.end(), end)
+    if close >= 0 and text.find("```", close + 4, end) < 0:
+        return body_text(text, m.end(), close)
+    chosen = choose_best_block(find_code_blocks(text, start, end), prefer_lang)
+    if chosen is None:
+        return text if start == 0 and end == len(text) else text[start:end]
+    return block_body(text, chosen)
+
+
+def split_into_file_sections(text: str) -> List[FileSection]:
+    return SectionSplitter(spool=False).feed(text, final=True)
+
+
+def encode_content(content: str) -> bytes:
+    # Los mismos bytes que escribe atomic_write_text (utf-8, errors="replace", sin traducir \n)
+    return content.encode("utf-8", "replace")
+
+
+def decode_base64_section(body: str) -> bytes:
+    # Modo no estricto: ignora saltos de línea y espacios; admite también la variante urlsafe
+    return binascii.a2b_base64(body.translate(URLSAFE_TO_STD_STR))
+
+
+# encoding= admitidos -> función cuerpo de la sección (str) -> bytes a escribir
+SECTION_DECODERS = {
+    "base64": decode_base64_section,
+    "b64": decode_base64_section,
+    "hex": bytes.fromhex,
+    "utf-8": encode_content,
+    "utf8": encode_content,
+    "text": encode_content,
+}
 
 
-def split_into_file_sections(text: str) -> List[Tuple[str, str]]:
-    matches = list(FILE_HEADER_RE.finditer(text))
-    if not matches:
-        return []
-    sections: List[Tuple[str, str]] = []
-    for i, m in enumerate(matches):
-        relpath = m.group("path").strip()
-        start = m.end()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-        body = text[start:end].strip("\n")
-        sections.append((relpath, body))
-    return sections
+def split_encoding(raw_path: str) -> Tuple[str, Optional[str]]:
+    """"x.png; encoding=base64" -> ("x.png", "base64"). Sin ese sufijo la ruta queda tal cual."""
+    path, sep, param = raw_path.rpartition(";")
+    m = ENCODING_PARAM_RE.fullmatch(param) if sep else None
+    if m is None:
+        return raw_path, None
+    return path.rstrip(), m.group(1).lower()
 
 
 def safe_join(base: Path, rel: str) -> Path:
@@ -148,6 +708,27 @@ def safe_join(base: Path, rel: str) -> Path:
     raise ValueError(f"Ruta insegura (path traversal): {rel}")
 
 
+def fsync_dir(path: Path) -> None:
+    """fsync de un directorio, para que los renames sobrevivan a un corte (no aplica en Windows)."""
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def unlink_quiet(path) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
 def atomic_write_text(path: Path, content: str) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     with tempfile.NamedTemporaryFile(
@@ -159,6 +740,391 @@ def atomic_write_text(path: Path, content: str) -> None:
         tf.flush()
         os.fsync(tf.fileno())
     os.replace(tmp_name, path)
+    fsync_dir(path.parent)
+
+
+def as_bytes(content: Union[str, bytes]) -> bytes:
+    return content if isinstance(content, bytes) else encode_content(content)
+
+
+def write_all(fd: int, data: bytes) -> None:
+    """os.write() hasta el final; lo pendiente tras una escritura parcial es un slice de memoryview (sin copias)."""
+    view = memoryview(data)
+    while view:
+        n = os.write(fd, view[:WRITE_CHUNK])
+        view = view[n:]
+
+
+def write_tmp(target: Path, data: bytes) -> str:
+    """Escribe data (con fsync) a un temporal junto a target y devuelve su ruta."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(target.parent), prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        try:
+            write_all(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except BaseException:
+        unlink_quiet(tmp)
+        raise
+    return tmp
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    os.replace(write_tmp(path, data), path)
+    fsync_dir(path.parent)
+
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    buf = bytearray(HASH_CHUNK)
+    view = memoryview(buf)
+    with open(path, "rb") as fp:
+        while True:
+            n = fp.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
+
+
+class HashManifest:
+    """
+    Caché de hashes de un outdir: {ruta relativa: [tamaño, mtime_ns, sha256]}.
+    Si un archivo sigue con el mismo tamaño y mtime_ns que cuando se guardó, se usa el
+    hash guardado en vez de leerlo entero. Es reconstruible: si falta, está corrupta o
+    cambia MANIFEST_VERSION, se empieza de cero.
+    """
+
+    def __init__(self, path: Path, root: Path):
+        self.path = path.resolve()
+        self.root = root.resolve()
+        self._lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(path, encoding="utf-8") as fp:
+                data = json.load(fp)
+            self.entries = data["files"] if data.get("version") == MANIFEST_VERSION else {}
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.entries = {}
+
+    def _key(self, target: Path) -> str:
+        return target.relative_to(self.root).as_posix()
+
+    def digest(self, target: Path, st: os.stat_result) -> str:
+        """sha256 del archivo (st: su stat), de la caché si no ha cambiado."""
+        with self._lock:
+            entry = self.entries.get(self._key(target))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        digest = sha256_file(target)
+        self.record(target, st, digest)
+        return digest
+
+    def record(self, target: Path, st: os.stat_result, digest: str) -> None:
+        # Con un mtime tan reciente no se guarda: en sistemas de archivos con resolución
+        # de 1s otra escritura en el mismo segundo no lo movería.
+        if time.time() - st.st_mtime < FRESH_GUARD_SECONDS:
+            return
+        entry = [st.st_size, st.st_mtime_ns, digest]
+        with self._lock:
+            key = self._key(target)
+            if self.entries.get(key) != entry:
+                self.entries[key] = entry
+                self.dirty = True
+
+    def save(self) -> None:
+        if self.dirty:
+            payload = {"version": MANIFEST_VERSION, "files": self.entries}
+            atomic_write_text(self.path, json.dumps(payload, separators=(",", ":")))
+            self.dirty = False
+
+
+def same_content(target: Path, data: bytes, manifest: Optional[HashManifest] = None) -> bool:
+    """¿target ya tiene exactamente estos bytes? Primero el tamaño; luego el hash, leyendo por partes."""
+    try:
+        st = os.stat(target)
+    except OSError:
+        return False
+    if not stat.S_ISREG(st.st_mode) or st.st_size != len(data):
+        return False
+    digest = hashlib.sha256(data).hexdigest()
+    if manifest is not None:
+        return manifest.digest(target, st) == digest
+    return sha256_file(target) == digest
+
+
+class BatchWriter:
+    """
+    Escribe todas las secciones de un bundle "todo o nada":
+      1) add(): cada archivo va a un temporal en su mismo directorio, escrito y con
+         fsync en un pool de hilos (en paralelo, no uno detrás de otro).
+      2) commit(): si algún temporal falló se borran todos y no se toca nada; si no,
+         os.replace() de cada uno (si una ruta se repite cuenta la última) y un solo
+         fsync por directorio afectado.
+    Con rollback=True, antes de reemplazar se guarda un hardlink (o copia) de cada
+    archivo existente: si falla un rename se restauran los anteriores y se borran los
+    nuevos. Sin rollback, lo ya renombrado se queda (y se avisa cuántos).
+    Con skip_unchanged=True, los archivos cuyo contenido ya es idéntico en disco no se
+    escriben (ni cambia su mtime); manifest evita volver a leerlos en cada ejecución.
+    """
+
+    def __init__(self, outdir: Path, jobs: int = WRITE_JOBS, rollback: bool = False,
+                 skip_unchanged: bool = False, manifest: Optional[HashManifest] = None):
+        self.outdir = outdir.resolve()
+        self.jobs = max(1, jobs)
+        self.rollback = rollback
+        self.skip_unchanged = skip_unchanged or manifest is not None
+        self.manifest = manifest
+        self._pool = ThreadPoolExecutor(max_workers=self.jobs)
+        # Contenidos esperando hilo: acotado para que --stream no acumule el bundle entero
+        self._slots = threading.BoundedSemaphore(self.jobs * 2)
+        self._staged: List[Tuple[Path, Future]] = []
+
+    def add(self, target: Path, content: Union[str, bytes]) -> None:
+        self._slots.acquire()
+        try:
+            fut = self._pool.submit(self._stage, target, content)
+        except BaseException:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        self._staged.append((target, fut))
+
+    def _stage(self, target: Path, content: Union[str, bytes]) -> Tuple[Optional[str], Optional[str]]:
+        """(temporal o None si no hay cambios, sha256 si hay manifest)."""
+        data = as_bytes(content)
+        if self.skip_unchanged and same_content(target, data, self.manifest):
+            return None, None
+        digest = hashlib.sha256(data).hexdigest() if self.manifest is not None else None
+        return write_tmp(target, data), digest
+
+    def _collect(self) -> Tuple[Dict[Path, Tuple[Optional[str], Optional[str]]], Optional[BaseException]]:
+        """Espera a todos los temporales: {destino: (temporal, sha256)} y el primer error."""
+        staged: Dict[Path, Tuple[Optional[str], Optional[str]]] = {}
+        error: Optional[BaseException] = None
+        for target, fut in self._staged:
+            try:
+                result = fut.result()
+            except Exception as e:
+                error = error or e
+                continue
+            previous = staged.pop(target, None)  # ruta repetida: la anterior no se usa
+            if previous and previous[0]:
+                unlink_quiet(previous[0])
+            staged[target] = result
+        self._staged = []
+        return staged, error
+
+    def abort(self) -> None:
+        """Descarta lo añadido (p. ej. si la entrada falla a mitad de --stream)."""
+        staged, _ = self._collect()
+        for tmp, _ in staged.values():
+            if tmp:
+                unlink_quiet(tmp)
+        self._pool.shutdown()
+
+    def commit(self) -> Tuple[List[Path], List[Path]]:
+        """Aplica el lote: (escritos, sin cambios). Si algo falla, OSError."""
+        staged, error = self._collect()
+        try:
+            temps = [(target, tmp) for target, (tmp, _) in staged.items() if tmp]
+            unchanged = [target for target, (tmp, _) in staged.items() if not tmp]
+            if error is not None:
+                for _, tmp in temps:
+                    unlink_quiet(tmp)
+                raise OSError(f"no se escribió ningún archivo: {error}")
+            backups: Dict[Path, Optional[str]] = {}
+            done: List[Path] = []
+            try:
+                for target, tmp in temps:
+                    if self.rollback:
+                        backups[target] = self._backup(target)
+                    os.replace(tmp, target)
+                    done.append(target)
+            except OSError as e:
+                for _, tmp in temps[len(done):]:
+                    unlink_quiet(tmp)
+                if not self.rollback:
+                    self._sync_dirs(done)
+                    raise OSError(f"{e} (quedaron escritos {len(done)} de {len(temps)} archivos)") from e
+                failed = self._restore(backups)
+                self._sync_dirs(backups)
+                if failed:
+                    raise OSError(f"{e} (no se pudieron restaurar: {', '.join(failed)})") from e
+                raise OSError(f"{e} (se restauraron los archivos anteriores)") from e
+            self._sync_dirs(done)
+            for backup in backups.values():
+                if backup:
+                    unlink_quiet(backup)
+            if self.manifest is not None:
+                for target in done:
+                    try:
+                        self.manifest.record(target, os.stat(target), staged[target][1])
+                    except OSError:
+                        pass
+                self.manifest.save()
+            return done, unchanged
+        finally:
+            self._pool.shutdown()
+
+    @staticmethod
+    def _backup(target: Path) -> Optional[str]:
+        if not target.is_file():
+            return None
+        backup = str(target.parent / f".{target.name}.{os.urandom(4).hex()}.bak")
+        try:
+            os.link(target, backup)  # sin copiar: el inode viejo sigue vivo con otro nombre
+        except OSError:
+            shutil.copy2(target, backup)
+        return backup
+
+    @staticmethod
+    def _restore(backups: Dict[Path, Optional[str]]) -> List[str]:
+        failed = []
+        for target, backup in backups.items():
+            try:
+                if backup is None:
+                    unlink_quiet(target)  # no existía antes del lote
+                else:
+                    os.replace(backup, target)
+            except OSError:
+                failed.append(str(target))
+        return failed
+
+    def _sync_dirs(self, targets: Iterable[Path]) -> None:
+        # Directorio de cada archivo y los que haya por encima hasta outdir (pueden ser nuevos)
+        dirs = set()
+        for target in targets:
+            d = target.parent
+            while d not in dirs:
+                dirs.add(d)
+                if d == self.outdir or self.outdir not in d.parents:
+                    break
+                d = d.parent
+        list(self._pool.map(fsync_dir, dirs))
+
+
+def commit_batch(writer: BatchWriter, unsafe: int) -> int:
+    try:
+        written, unchanged = writer.commit()
+    except OSError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 5
+    for target in written:
+        print(f"OK: escrito {target}")
+    for target in unchanged:
+        print(f"OK: sin cambios {target}")
+    print(f"Resumen: {len(written)} escritos, {len(unchanged)} sin cambios, {unsafe} inseguros o inválidos")
+    return 0
+
+
+def write_file(target: Path, content: Union[str, bytes], skip_unchanged: bool, note: str = "") -> None:
+    """Un solo archivo (--single / output.txt / sin lote), texto o bytes."""
+    data = as_bytes(content)
+    if skip_unchanged and same_content(target, data):
+        print(f"OK: {note}sin cambios {target}")
+        return
+    atomic_write_bytes(target, data)
+    print(f"OK: {note}escrito {target}")
+
+
+def write_section(outdir: Path, section: FileSection, dry_run: bool,
+                  writer: Optional[BatchWriter] = None, skip_unchanged: bool = False) -> bool:
+    rel, encoding = split_encoding(section.path)
+    content: Union[str, bytes] = strip_md_wrappers(section.source, None, section.start, section.end)
+    try:
+        target = safe_join(outdir, rel)
+    except ValueError as e:
+        print(f"SKIP: {e}", file=sys.stderr)
+        return False
+    if writer is not None and writer.manifest is not None and target == writer.manifest.path:
+        print(f"SKIP: es el manifest de --manifest: {target}", file=sys.stderr)
+        return False
+
+    if encoding is not None:
+        decoder = SECTION_DECODERS.get(encoding)
+        if decoder is None:
+            print(f"SKIP: encoding desconocido '{encoding}': {target}", file=sys.stderr)
+            return False
+        try:
+            content = decoder(content)
+        except (binascii.Error, ValueError) as e:
+            print(f"SKIP: no se pudo decodificar ({encoding}) {target}: {e}", file=sys.stderr)
+            return False
+
+    if dry_run:
+        if skip_unchanged and same_content(target, as_bytes(content)):
+            print(f"[DRY-RUN] sin cambios: {target}")
+        else:
+            print(f"[DRY-RUN] escribiría: {target} (len={len(content)})")
+        return True
+
+    if writer is not None:
+        writer.add(target, content)  # se escribe de verdad en commit()
+        return True
+    write_file(target, content, skip_unchanged)
+    return True
+
+
+def default_manifest_path(outdir: Path) -> Path:
+    """.<outdir>.ai_write_manifest.json junto al outdir (fuera del árbol que se escribe)."""
+    outdir = outdir.resolve()
+    return outdir.parent / f".{outdir.name}{MANIFEST_NAME}"
+
+
+def make_writer(args: argparse.Namespace, outdir: Path) -> Optional[BatchWriter]:
+    if args.dry_run:
+        return None
+    manifest = None
+    if args.manifest is not None:
+        path = Path(args.manifest).expanduser() if args.manifest else default_manifest_path(outdir)
+        manifest = HashManifest(path, outdir)
+    return BatchWriter(outdir, args.jobs, args.rollback, args.skip_unchanged, manifest)
+
+
+def main_stream(args: argparse.Namespace, outdir: Path) -> int:
+    """Modo multi-archivo con --stream: cada sección se manda a escribir apenas se completa."""
+    splitter = SectionSplitter()
+    writer = make_writer(args, outdir)
+    skip = args.skip_unchanged or args.manifest is not None
+    staged = 0
+    try:
+        for text in iter_decoded_text(args.b64, args.input_file):
+            for section in splitter.feed(text):
+                staged += write_section(outdir, section, args.dry_run, writer, skip)
+        for section in splitter.close():
+            staged += write_section(outdir, section, args.dry_run, writer, skip)
+    except Exception as e:
+        if writer is not None:
+            writer.abort()  # entrada cortada: no se escribe nada del bundle
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+
+    if splitter.headers:
+        if not staged:
+            if writer is not None:
+                writer.abort()
+            print("No se escribió ningún archivo (rutas inseguras o vacías).", file=sys.stderr)
+            return 4
+        return commit_batch(writer, splitter.headers - staged) if writer is not None else 0
+
+    if writer is not None:
+        writer.abort()
+
+    # Si no hay "file:", escribe a un default
+    default_name = "output.txt"
+    content = strip_md_wrappers(splitter.preamble_text(), None)
+    splitter.preamble.close()
+    target = safe_join(outdir, default_name)
+
+    if args.dry_run:
+        print(f"[DRY-RUN] no se detectó 'file:'; escribiría: {target}")
+        return 0
+
+    write_file(target, content, skip, "no se detectó 'file:'; ")
+    return 0
 
 
 def main() -> int:
@@ -171,13 +1137,31 @@ def main() -> int:
     ap.add_argument("--single", help="Modo archivo único: ruta relativa a escribir (ej: main.py).")
     ap.add_argument("--lang", help="En modo --single, lenguaje preferido del fence (python, bash, etc.).")
     ap.add_argument("--dry-run", action="store_true", help="No escribe; solo muestra qué haría.")
+    ap.add_argument("--stream", action="store_true",
+                    help="Decodifica y escribe por partes (memoria acotada para bundles grandes).")
+    ap.add_argument("--jobs", type=int, default=WRITE_JOBS,
+                    help=f"Hilos para escribir los archivos del bundle (default: {WRITE_JOBS}).")
+    ap.add_argument("--rollback", action="store_true",
+                    help="Si falla algún reemplazo, restaura los archivos anteriores.")
+    ap.add_argument("--skip-unchanged", action="store_true",
+                    help="No reescribe archivos cuyo contenido ya es idéntico (tamaño + sha256).")
+    ap.add_argument("--manifest", nargs="?", const="", default=None, metavar="RUTA",
+                    help=f"Caché de hashes para --skip-unchanged (implícito). "
+                         f"Default: .<outdir>{MANIFEST_NAME} junto al outdir")
     args = ap.parse_args()
+    skip = args.skip_unchanged or args.manifest is not None
 
     outdir = Path(args.outdir).expanduser()
     outdir.mkdir(parents=True, exist_ok=True)
 
+    if args.stream and not args.single:
+        return main_stream(args, outdir)
+
     try:
-        decoded_text = read_b64_input(args.b64, args.input_file)
+        if args.stream:
+            decoded_text = "".join(iter_decoded_text(args.b64, args.input_file))
+        else:
+            decoded_text = read_b64_input(args.b64, args.input_file)
     except Exception as e:
         print(f"ERROR: {e}", file=sys.stderr)
         return 2
@@ -198,35 +1182,23 @@ def main() -> int:
             print("----- fin contenido -----")
             return 0
 
-        atomic_write_text(target, content)
-        print(f"OK: escrito {target}")
+        write_file(target, content, skip)
         return 0
 
     # Modo multi-archivo por headers "file:"
     sections = split_into_file_sections(decoded_text)
     if sections:
-        wrote = False
-        for relpath, section_text in sections:
-            content = strip_md_wrappers(section_text, None)
-            try:
-                target = safe_join(outdir, relpath)
-            except ValueError as e:
-                print(f"SKIP: {e}", file=sys.stderr)
-                continue
-
-            if args.dry_run:
-                print(f"[DRY-RUN] escribiría: {target} (len={len(content)})")
-                wrote = True
-                continue
+        writer = make_writer(args, outdir)
+        staged = 0
+        for section in sections:
+            staged += write_section(outdir, section, args.dry_run, writer, skip)
 
-            atomic_write_text(target, content)
-            print(f"OK: escrito {target}")
-            wrote = True
-
-        if not wrote:
+        if not staged:
+            if writer is not None:
+                writer.abort()
             print("No se escribió ningún archivo (rutas inseguras o vacías).", file=sys.stderr)
             return 4
-        return 0
+        return commit_batch(writer, len(sections) - staged) if writer is not None else 0
 
     # Si no hay "file:", escribe a un default
     default_name = "output.txt"
@@ -237,8 +1209,7 @@ def main() -> int:
         print(f"[DRY-RUN] no se detectó 'file:'; escribiría: {target}")
         return 0
 
-    atomic_write_text(target, content)
-    print(f"OK: no se detectó 'file:'; escrito {target}")
+    write_file(target, content, skip, "no se detectó 'file:'; ")
     return 0
 
 
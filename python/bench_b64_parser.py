@@ -0,0 +1,158 @@
+# bench_b64_parser.py
+"""
+Benchmark del parser de headers "file:" y fences ``` de ai_write_files_b64.py:
+máquina de estados de una sola pasada vs las regex anteriores (FILE_HEADER_RE y
+FENCE_RE, que retroceden sobre fences sin cerrar y rachas de líneas en blanco).
+
+Cada corpus es una entrada "patológica" (o una normal, para comparar). Antes de
+medir se verifica que ambas versiones dan exactamente las mismas secciones y el
+mismo contenido, también alimentando el splitter por trozos como en --stream.
+Se mide sobre el texto como lo recibe el parser en el CLI: con los CRLF/CR ya
+normalizados una sola vez (normalize_newlines); la equivalencia se comprueba
+también sobre el texto crudo.
+
+Uso:
+  python bench_b64_parser.py                          # todos los corpus, 10 KB .. 1 MB
+  python bench_b64_parser.py --corpus unclosed --sizes 1M --legacy-max 0
+"""
+import argparse
+import random
+import re
+import time
+
+from ai_write_files_b64 import SectionSplitter, normalize_newlines, split_into_file_sections, strip_md_wrappers
+
+# -----------------------------
+# Versión anterior (referencia)
+# -----------------------------
+FENCE_RE = re.compile(
+    r"```(?P<lang>[a-zA-Z0-9_+-]*)[ \t]*\n(?P<body>.*?)(?:\n```[ \t]*\n?|```[ \t]*$)",
+    re.DOTALL,
+)
+
+FILE_HEADER_RE = re.compile(
+    r"(?im)^(?:\s*(?:#+\s*)?)?(?:file|archivo)\s*:\s*(?P<path>.+?)\s*$"
+)
+
+
+def strip_md_wrappers_legacy(text: str) -> str:
+    blocks = [m.group("body").replace("\r\n", "\n").replace("\r", "\n") for m in FENCE_RE.finditer(text)]
+    if not blocks:
+        return text
+    return max(blocks, key=len)
+
+
+def parse_legacy(text: str):
+    matches = list(FILE_HEADER_RE.finditer(text))
+    if not matches:
+        return [("output.txt", strip_md_wrappers_legacy(text))]
+    out = []
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        out.append((m.group("path").strip(), strip_md_wrappers_legacy(text[m.end():end].strip("\n"))))
+    return out
+
+
+def parse_new(text: str):
+    sections = split_into_file_sections(text)
+    if not sections:
+        return [("output.txt", strip_md_wrappers(text, None))]
+    return [(s.path, strip_md_wrappers(s.source, None, s.start, s.end)) for s in sections]
+
+
+def parse_stream(text: str, chunk=4096):
+    splitter = SectionSplitter()
+    sections = []
+    for i in range(0, len(text), chunk):
+        sections += splitter.feed(text[i:i + chunk])
+    sections += splitter.close()
+    if not splitter.headers:
+        return [("output.txt", strip_md_wrappers(splitter.preamble_text(), None))]
+    return [(s.path, strip_md_wrappers(s.source, None, s.start, s.end)) for s in sections]
+
+
+# -----------------------------
+# Corpus
+# -----------------------------
+def repeat_to(piece_fn, size: int, seed=1234) -> str:
+    rnd = random.Random(seed)
+    parts, total = [], 0
+    while total < size:
+        p = piece_fn(rnd)
+        parts.append(p)
+        total += len(p)
+    return "".join(parts)[:size]
+
+
+def bundle_piece(rnd):
+    lang = rnd.choice(["python", "", "js", "md"])
+    body = "\n".join(rnd.choice(["x = 1", "print('hola')", "", "  # ñ €", "def f():"]) for _ in range(rnd.randint(1, 30)))
+    return f"{rnd.choice(['file: ', '## File: ', 'archivo: '])}src/m{rnd.randint(0, 999)}.py\n```{lang}\n{body}\n```\n\n"
+
+
+CORPUS = {
+    # Salida normal de un modelo: muchas secciones con su fence
+    "bundle": lambda size: repeat_to(bundle_piece, size),
+    # Aperturas sin cierre: la regex recorría el resto del texto por cada una
+    "unclosed": lambda size: "file: a.py\n" + repeat_to(lambda r: "ver ```py\nx = 1\n", size),
+    "backticks": lambda size: "file: a.md\n" + repeat_to(lambda r: r.choice(["a````\n", "b```\n", "`` `\n", "c```md\n"]), size),
+    # Rachas enormes de líneas en blanco: ^\s* las recorría desde cada línea
+    "blank": lambda size: "file: a.py\nx\n" + "\n" * size + "x\n",
+    "blank_spaces": lambda size: "file: a.py\nx\n" + repeat_to(lambda r: " \t \n", size) + "x\n",
+    "hash_blank": lambda size: "file: a.py\nx\n#" + repeat_to(lambda r: "  \n\n", size) + "x\n",
+    # Líneas que parecen header pero no lo son (sin ":" / "#" sin palabra)
+    "nocolon": lambda size: repeat_to(lambda r: r.choice(["file a.py\n", "## archivo\n", "#\n", "  profile\n\n"]), size),
+    # Fences con CRLF (se normaliza \r\n en el cuerpo elegido)
+    "crlf": lambda size: repeat_to(lambda r: "file: w.bat\r\n```bat\r\necho hola\r\n```\r\n", size),
+}
+
+
+def parse_size(s: str) -> int:
+    s = s.strip().upper()
+    mult = {"K": 1024, "M": 1024 * 1024}.get(s[-1:], 1)
+    return int(float(s.rstrip("KM")) * mult)
+
+
+def best_of(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del parser de ai_write_files_b64")
+    ap.add_argument("--corpus", default=",".join(CORPUS), help="Lista separada por comas")
+    ap.add_argument("--sizes", default="10K,64K,1M")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--legacy-max", default="10K",
+                    help="Tamaño máximo para medir (y comparar con) la versión anterior")
+    args = ap.parse_args()
+    legacy_max = parse_size(args.legacy_max)
+
+    print(f"{'corpus':>12} {'tamaño':>8} {'legacy ms':>10} {'nuevo ms':>10} {'stream ms':>10} {'speedup':>8}")
+    for name in args.corpus.split(","):
+        for label in args.sizes.split(","):
+            size = parse_size(label)
+            raw = CORPUS[name](size)
+            text = normalize_newlines(raw)
+            for sample in {raw, text}:
+                expected = parse_new(sample)
+                if parse_stream(sample) != expected:
+                    raise SystemExit(f"[ERROR] --stream distinto en {name} {label}")
+                if size <= legacy_max and parse_legacy(sample) != expected:
+                    raise SystemExit(f"[ERROR] Salida distinta a la versión anterior en {name} {label}")
+            t_new = best_of(parse_new, text, args.repeat)
+            t_stream = best_of(parse_stream, text, args.repeat)
+            if size <= legacy_max:
+                t_old = best_of(parse_legacy, text, args.repeat)
+                old, speedup = f"{t_old * 1000:10.2f}", f"{t_old / t_new:7.2f}x"
+            else:
+                old, speedup = f"{'-':>10}", f"{'-':>8}"
+            print(f"{name:>12} {label:>8} {old} {t_new * 1000:10.2f} {t_stream * 1000:10.2f} {speedup}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# bench_strip_reserved.py
+"""
+Benchmark de strip_reserved (queue_watcher.py): motor de reglas compilado vs la
+versión anterior de seis pasadas encadenadas.
+
+Verifica primero que ambas dan exactamente la misma salida en cada tamaño.
+
+Uso:
+  python bench_strip_reserved.py                  # 1 KB .. 10 MB
+  python bench_strip_reserved.py --sizes 1K,64K --repeat 5
+"""
+import argparse
+import random
+import re
+import time
+
+from queue_watcher import StreamSanitizer, strip_reserved
+
+# -----------------------------
+# Versión anterior (referencia)
+# -----------------------------
+FLOW_UNDERSCORE_RE = re.compile(r"\bflow_([A-Za-z0-9_]+)\b", re.IGNORECASE)
+FLOW_TOKEN_RE = re.compile(r"\bflow[A-Za-z0-9_]*\b", re.IGNORECASE)
+EMPTY_PARENS_RE = re.compile(r"\(\s*\)")
+EOF_RE = re.compile(r"\bEOF\b", re.IGNORECASE)
+
+
+def strip_reserved_legacy(text: str) -> str:
+    if not text:
+        return text
+    text = EOF_RE.sub("E-O-F", text)
+    text = FLOW_UNDERSCORE_RE.sub(r"\1", text)
+    text = FLOW_TOKEN_RE.sub("", text)
+    text = EMPTY_PARENS_RE.sub("", text)
+    text = re.sub(r"[ \t]{2,}", " ", text)
+    text = re.sub(r"\s+([,.;:!?])", r"\1", text)
+    return text.strip()
+
+
+def strip_reserved_stream(text: str, chunk=64) -> str:
+    s = StreamSanitizer()
+    out = [s.feed(text[i:i + chunk]) for i in range(0, len(text), chunk)]
+    out.append(s.close())
+    return "".join(out)
+
+
+# -----------------------------
+# Entradas sintéticas (parecidas a la salida de un modelo)
+# -----------------------------
+WORDS = [
+    "el", "agente", "ejecuta", "la", "tarea", "sobre", "archivo", "respuesta", "log",
+    "función", "niño", "data", "value", "step", "EOF", "flowStep", "flow_output",
+    "FLOW_flowX", "( flowTmp )", "(nota)", "( )", ",", ".", ":", "!", "?", "\n", "\n\n",
+]
+WEIGHTS = [8, 6, 5, 8, 4, 3, 3, 3, 3, 2, 1, 3, 3, 2, 1, 1, 1, 1, 1, 1, 1, 3, 3, 1, 1, 1, 2, 1]
+
+
+def make_text(size: int, seed=1234) -> str:
+    rnd = random.Random(seed)
+    parts, total = [], 0
+    while total < size:
+        w = rnd.choices(WORDS, WEIGHTS)[0]
+        sep = rnd.choice((" ", " ", " ", "  ", "\t"))
+        parts.append(w + sep)
+        total += len(w) + len(sep)
+    return "".join(parts)[:size]
+
+
+def parse_size(s: str) -> int:
+    s = s.strip().upper()
+    mult = {"K": 1024, "M": 1024 * 1024}.get(s[-1:], 1)
+    return int(float(s.rstrip("KM")) * mult)
+
+
+def best_of(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de strip_reserved")
+    ap.add_argument("--sizes", default="1K,10K,100K,1M,10M")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'tamaño':>8} {'legacy ms':>10} {'motor ms':>10} {'stream ms':>10} {'speedup':>8}")
+    for label in args.sizes.split(","):
+        text = make_text(parse_size(label))
+        expected = strip_reserved_legacy(text)
+        if strip_reserved(text) != expected or strip_reserved_stream(text) != expected:
+            raise SystemExit(f"[ERROR] Salida distinta a la versión anterior en {label}")
+        t_old = best_of(strip_reserved_legacy, text, args.repeat)
+        t_new = best_of(strip_reserved, text, args.repeat)
+        t_stream = best_of(strip_reserved_stream, text, args.repeat)
+        print(f"{label:>8} {t_old * 1000:10.2f} {t_new * 1000:10.2f} {t_stream * 1000:10.2f} {t_old / t_new:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
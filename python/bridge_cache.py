@@ -0,0 +1,174 @@
+# bridge_cache.py
+"""
+Caché de respuestas del host (opcional).
+
+Clave: sha256 del JSON canónico de {name, args}, así el mismo prompt (p.ej. la
+concatenación initial.txt + continue.txt que arma bash.sh) se responde sin pasar
+por la pestaña del navegador.
+
+- Memoria: LRU con TTL y tope en bytes (se cuenta el JSON serializado).
+- Disco (opcional): SQLite en modo WAL; se recarga al arrancar el host.
+- Contadores de hits/misses/evicciones para el método `stats` del host.
+
+Configuración por entorno:
+  BRIDGE_CACHE=1                 activa la caché (default: desactivada)
+  BRIDGE_CACHE_TTL=3600          segundos de vida de cada entrada (0 = sin caducidad)
+  BRIDGE_CACHE_MAX_BYTES=67108864
+  BRIDGE_CACHE_DB=/ruta/cache.db persistencia en disco (vacío = solo memoria)
+  BRIDGE_CACHE_METHODS=send      métodos cacheables, separados por coma
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+def cache_key(name, args) -> str:
+    canon = json.dumps({"name": name, "args": args}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600.0, db_path=None, methods=("send",)):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.methods = set(methods)
+        self.entries = OrderedDict()  # key -> (expires_at, payload_bytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db = None
+        if db_path:
+            self._open_db(db_path)
+
+    # ---------- claves ----------
+    def key_for(self, msg):
+        """Clave de caché para la petición, o None si no es cacheable."""
+        if msg.get("type") != "RUN" or msg.get("name") not in self.methods:
+            return None
+        if msg.get("cache") is False:
+            return None
+        return cache_key(msg.get("name"), msg.get("args") or [])
+
+    @staticmethod
+    def is_cacheable_response(res) -> bool:
+        # Solo respuestas buenas de punta a punta (host y método de la extensión)
+        if not isinstance(res, dict) or res.get("ok") is not True:
+            return False
+        inner = res.get("res")
+        return not (isinstance(inner, dict) and inner.get("ok") is False)
+
+    # ---------- lectura / escritura ----------
+    def get(self, key, req_id):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, payload = entry
+            if expires_at and expires_at <= time.time():
+                self._drop(key)
+                if self.db is not None:
+                    self.db.commit()
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        res = json.loads(payload)
+        res["id"] = req_id
+        res["cached"] = True
+        return res
+
+    def shared(self, res, req_id):
+        """Respuesta de una petición idéntica que estaba en vuelo: se sirve y cuenta como hit."""
+        self.hits += 1
+        return dict(res, id=req_id, cached=True)
+
+    def put(self, key, res):
+        stored = dict(res)
+        stored.pop("id", None)
+        stored.pop("cached", None)
+        payload = json.dumps(stored, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else 0.0
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (expires_at, payload)
+        self.total_bytes += len(payload)
+        if self.db is not None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO cache(key, expires_at, payload) VALUES (?, ?, ?)",
+                (key, expires_at, payload),
+            )
+            self.db.commit()
+        self._evict()
+
+    def _drop(self, key):
+        _, payload = self.entries.pop(key)
+        self.total_bytes -= len(payload)
+        if self.db is not None:
+            self.db.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self):
+        dropped = False
+        while self.total_bytes > self.max_bytes and self.entries:
+            oldest = next(iter(self.entries))
+            self._drop(oldest)
+            self.evictions += 1
+            dropped = True
+        if dropped and self.db is not None:
+            self.db.commit()
+
+    # ---------- disco ----------
+    def _open_db(self, db_path):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db = sqlite3.connect(db_path, isolation_level="DEFERRED")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload BLOB NOT NULL)"
+        )
+        now = time.time()
+        self.db.execute("DELETE FROM cache WHERE expires_at > 0 AND expires_at <= ?", (now,))
+        self.db.commit()
+        # rowid creciente ~ orden de inserción: se recargan las más viejas primero (LRU aproximado)
+        for key, expires_at, payload in self.db.execute("SELECT key, expires_at, payload FROM cache ORDER BY rowid"):
+            payload = bytes(payload)
+            self.entries[key] = (expires_at, payload)
+            self.total_bytes += len(payload)
+        self._evict()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "persistent": self.db is not None,
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def cache_from_env():
+    """Crea la caché según las variables BRIDGE_CACHE_*; None si está desactivada."""
+    if os.getenv("BRIDGE_CACHE", "0").lower() not in ("1", "true", "yes", "on"):
+        return None
+    methods = [m.strip() for m in os.getenv("BRIDGE_CACHE_METHODS", "send").split(",") if m.strip()]
+    return ResponseCache(
+        max_bytes=int(os.getenv("BRIDGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=float(os.getenv("BRIDGE_CACHE_TTL", "3600")),
+        db_path=os.getenv("BRIDGE_CACHE_DB") or None,
+        methods=methods,
+    )
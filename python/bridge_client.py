@@ -0,0 +1,213 @@
+# bridge_client.py
+"""
+Cliente del puente TCP (host.py) con conexiones persistentes y multiplexadas.
+
+Cada petición lleva un `id` único; varias peticiones pueden viajar a la vez por el
+mismo socket y las respuestas se enrutan de vuelta por `id` (el host las resuelve
+con su dict `pending`).
+
+Uso desde Python:
+
+    from bridge_client import get_pool
+    res = get_pool().call("send", ["hola", 0])
+
+    # streaming: imprime el texto a medida que llega
+    res = get_pool().call("send", ["hola", 0], on_chunk=lambda d: print(d, end="", flush=True))
+
+    # o varias en paralelo sobre la misma conexión
+    conn = get_pool().connection()
+    futs = [conn.submit("send", [p, 0]) for p in prompts]
+    results = [f.result() for f in futs]
+"""
+import itertools
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import Future
+
+from bridge_protocol import FrameError, recv_frame, send_frame
+
+SOCKET_HOST = os.getenv("SOCKET_HOST", "localhost")
+SOCKET_PORT = int(os.getenv("SOCKET_PORT", "7345"))
+DEFAULT_TIMEOUT = 900  # igual que el timeout histórico del CLI
+DEFAULT_POOL_SIZE = int(os.getenv("BRIDGE_POOL_SIZE", "2"))
+
+
+class BridgeError(Exception):
+    """La conexión con el host se perdió o no pudo establecerse."""
+
+
+class BridgeConnection:
+    """Un socket persistente hacia el host; un hilo lector despacha respuestas por `id`."""
+
+    def __init__(self, host=SOCKET_HOST, port=SOCKET_PORT, connect_timeout=10):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=connect_timeout)
+        # El lector bloquea en recv sin límite: los timeouts se aplican por petición
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+        self._futures = {}
+        self._chunk_handlers = {}
+        self._futures_lock = threading.Lock()
+        self.closed = False
+        self._reader = threading.Thread(target=self._read_loop, name=f"bridge-reader-{host}:{port}", daemon=True)
+        self._reader.start()
+
+    def submit(self, name, args=None, req_id=None, on_chunk=None, **extra) -> Future:
+        """
+        Envía una petición RUN y devuelve un Future con la respuesta completa del host.
+        Con `on_chunk(delta)` se pide modo streaming: el callback recibe cada trozo de
+        texto parcial (desde el hilo lector) antes de que se resuelva el Future.
+        """
+        req_id = req_id or uuid.uuid4().hex
+        payload = {"type": "RUN", "id": req_id, "name": name, "args": list(args or [])}
+        payload.update(extra)
+        if on_chunk is not None:
+            payload["stream"] = True
+
+        fut = Future()
+        with self._futures_lock:
+            if self.closed:
+                raise BridgeError("Conexión cerrada")
+            if req_id in self._futures:
+                raise ValueError(f"id duplicado en vuelo: {req_id}")
+            self._futures[req_id] = fut
+            if on_chunk is not None:
+                self._chunk_handlers[req_id] = on_chunk
+        try:
+            with self._send_lock:
+                send_frame(self.sock, payload)
+        except Exception as e:
+            with self._futures_lock:
+                self._futures.pop(req_id, None)
+                self._chunk_handlers.pop(req_id, None)
+            self._fail_all(BridgeError(f"Error enviando al host: {e}"))
+            raise BridgeError(f"Error enviando al host: {e}") from e
+        return fut
+
+    def call(self, name, args=None, timeout=DEFAULT_TIMEOUT, req_id=None, **extra) -> dict:
+        req_id = req_id or uuid.uuid4().hex
+        fut = self.submit(name, args, req_id=req_id, **extra)
+        try:
+            return fut.result(timeout=timeout)
+        finally:
+            # Timeout (o interrupción): en una conexión del pool la entrada quedaría para
+            # siempre y una respuesta tardía iría a un handler muerto
+            self._forget(req_id, fut)
+
+    def _forget(self, req_id, fut):
+        with self._futures_lock:
+            if self._futures.get(req_id) is fut:
+                del self._futures[req_id]
+                self._chunk_handlers.pop(req_id, None)
+        fut.cancel()
+
+    @property
+    def in_flight(self) -> int:
+        with self._futures_lock:
+            return len(self._futures)
+
+    def _read_loop(self):
+        err = None
+        try:
+            while True:
+                msg = recv_frame(self.sock)
+                if msg is None:
+                    break
+                if not isinstance(msg, dict):
+                    continue
+                req_id = msg.get("id")
+                if msg.get("type") == "CHUNK":
+                    handler = self._chunk_handlers.get(req_id)
+                    if handler is not None:
+                        try:
+                            handler(msg.get("delta") or "")
+                        except Exception:
+                            pass  # un callback roto no debe tumbar el lector
+                    continue
+                with self._futures_lock:
+                    fut = self._futures.pop(req_id, None)
+                    self._chunk_handlers.pop(req_id, None)
+                if fut is not None:
+                    fut.set_result(msg)
+                elif req_id is None:
+                    # Error del host sin id (frame/JSON inválido): no se puede enrutar
+                    err = BridgeError(f"Error del host: {msg}")
+                    break
+        except (OSError, FrameError, ValueError) as e:
+            err = e
+        self._fail_all(BridgeError(f"Conexión con el host perdida: {err}" if err else "El host cerró la conexión"))
+
+    def _fail_all(self, exc):
+        with self._futures_lock:
+            self.closed = True
+            futs = list(self._futures.values())
+            self._futures.clear()
+            self._chunk_handlers.clear()
+        for f in futs:
+            if not f.done():
+                f.set_exception(exc)
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+        self._fail_all(BridgeError("Conexión cerrada por el cliente"))
+
+
+class BridgePool:
+    """
+    Pool pequeño de conexiones persistentes. Como cada conexión está multiplexada,
+    no hace falta "prestarlas": se reparten en round-robin y se reabren si se caen.
+    """
+
+    def __init__(self, host=SOCKET_HOST, port=SOCKET_PORT, size=DEFAULT_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.size = max(1, size)
+        self._conns = [None] * self.size
+        self._rr = itertools.count()
+        self._lock = threading.Lock()
+
+    def connection(self) -> BridgeConnection:
+        idx = next(self._rr) % self.size
+        with self._lock:
+            conn = self._conns[idx]
+            if conn is None or conn.closed:
+                conn = BridgeConnection(self.host, self.port)
+                self._conns[idx] = conn
+            return conn
+
+    def submit(self, name, args=None, **extra) -> Future:
+        return self.connection().submit(name, args, **extra)
+
+    def call(self, name, args=None, timeout=DEFAULT_TIMEOUT, **extra) -> dict:
+        return self.connection().call(name, args, timeout=timeout, **extra)
+
+    def close(self):
+        with self._lock:
+            for c in self._conns:
+                if c is not None:
+                    c.close()
+            self._conns = [None] * self.size
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host=SOCKET_HOST, port=SOCKET_PORT) -> BridgePool:
+    """Pool compartido por proceso para (host, port)."""
+    with _pools_lock:
+        pool = _pools.get((host, port))
+        if pool is None:
+            pool = _pools[(host, port)] = BridgePool(host, port)
+        return pool
@@ -0,0 +1,163 @@
+# bridge_protocol.py
+"""
+Framing del puente TCP (CLI <-> Host).
+
+Cada mensaje viaja como 4 bytes little-endian con la longitud del payload
+seguidos del JSON en UTF-8: el mismo framing que usa Native Messaging en STDIO
+(ver read_message/write_message en host.py).
+
+Clientes antiguos mandan el JSON crudo sin prefijo. Se detectan porque el primer
+byte es '{' o '[' y los 4 bytes, leídos como longitud, dan un valor imposible
+(>= LEGACY_THRESHOLD): JSON nunca lleva bytes de control < 0x09, así que el
+cuarto byte de un JSON crudo siempre deja la "longitud" por encima del umbral.
+"""
+import asyncio
+import json
+import os
+import struct
+
+HEADER = struct.Struct("<I")
+
+# Cualquier cabecera cuyo primer byte sea '{'/'[' y cuya longitud supere esto es un cliente legacy.
+LEGACY_THRESHOLD = 0x09000000  # ~144 MiB
+# Límite duro por frame. Siempre por debajo del umbral legacy para que la detección no sea ambigua.
+MAX_FRAME_BYTES = min(
+    int(os.getenv("BRIDGE_MAX_FRAME_BYTES", str(128 * 1024 * 1024))),
+    LEGACY_THRESHOLD - 1,
+)
+# Tamaño máximo de cada recv_into (no reservar buffers de kernel gigantes)
+RECV_CHUNK = 1024 * 1024
+
+
+class FrameError(Exception):
+    """Frame mal formado, demasiado grande o conexión cortada a mitad de un frame."""
+
+
+def encode_frame(obj) -> bytes:
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    if len(data) > MAX_FRAME_BYTES:
+        raise FrameError(f"Frame demasiado grande: {len(data)} bytes (máx {MAX_FRAME_BYTES})")
+    # Un único sendall: cabecera y datos separados chocan con Nagle + delayed ACK.
+    return HEADER.pack(len(data)) + data
+
+
+def send_frame(sock, obj) -> None:
+    sock.sendall(encode_frame(obj))
+
+
+def recv_into_exactly(sock, view: memoryview) -> int:
+    """
+    Llena `view` completo con recv_into. Devuelve los bytes leídos
+    (menos de len(view) solo si el peer cerró la conexión).
+    """
+    pos = 0
+    total = len(view)
+    while pos < total:
+        n = sock.recv_into(view[pos:], min(total - pos, RECV_CHUNK))
+        if n == 0:
+            break
+        pos += n
+    return pos
+
+
+def read_header(sock):
+    """
+    Lee los 4 bytes de cabecera.
+    Devuelve (header_bytes, leídos). leídos < 4 indica EOF.
+    """
+    header = bytearray(HEADER.size)
+    n = recv_into_exactly(sock, memoryview(header))
+    return bytes(header[:n]), n
+
+
+def is_legacy_header(header: bytes) -> bool:
+    if not header or header[:1] not in (b"{", b"["):
+        return False
+    if len(header) < HEADER.size:
+        # JSON crudo de menos de 4 bytes (p.ej. "{}") seguido de EOF
+        return True
+    return HEADER.unpack(header)[0] >= LEGACY_THRESHOLD
+
+
+def recv_frame_payload(sock, length: int) -> bytearray:
+    """Lee el payload de un frame en un buffer preasignado de `length` bytes."""
+    if length > MAX_FRAME_BYTES:
+        raise FrameError(f"Frame demasiado grande: {length} bytes (máx {MAX_FRAME_BYTES})")
+    buf = bytearray(length)
+    n = recv_into_exactly(sock, memoryview(buf))
+    if n < length:
+        raise FrameError(f"Conexión cerrada a mitad de frame: esperados={length}, leídos={n}")
+    return buf
+
+
+def recv_frame_bytes(sock):
+    """
+    Lee un frame completo y devuelve el payload (bytes UTF-8 del JSON).
+    Devuelve None si el peer cerró limpiamente antes de la cabecera.
+    """
+    header, n = read_header(sock)
+    if n == 0:
+        return None
+    if n < HEADER.size:
+        raise FrameError(f"Cabecera incompleta: {n} bytes")
+    (length,) = HEADER.unpack(header)
+    return recv_frame_payload(sock, length)
+
+
+def recv_frame(sock):
+    """Como recv_frame_bytes pero decodifica el JSON."""
+    payload = recv_frame_bytes(sock)
+    if payload is None:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+
+def _ends_like_json(buf) -> bool:
+    i = len(buf) - 1
+    while i >= 0 and buf[i] in b" \t\r\n":
+        i -= 1
+    return i >= 0 and buf[i] in b"}]"
+
+
+# =======================
+#  Variantes asyncio (host)
+# =======================
+async def read_header_async(reader) -> bytes:
+    """Lee la cabecera desde un asyncio.StreamReader. Devuelve menos de 4 bytes solo en EOF."""
+    try:
+        return await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+
+async def recv_frame_payload_async(reader, length: int) -> bytes:
+    if length > MAX_FRAME_BYTES:
+        raise FrameError(f"Frame demasiado grande: {length} bytes (máx {MAX_FRAME_BYTES})")
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError as e:
+        raise FrameError(f"Conexión cerrada a mitad de frame: esperados={length}, leídos={len(e.partial)}") from e
+
+
+async def recv_legacy_json_async(reader, prefix: bytes):
+    """
+    Compatibilidad con clientes sin framing: acumula bytes hasta que forman un JSON
+    completo (el cliente antiguo no cierra su lado de escritura, así que no hay EOF).
+    Solo intenta parsear cuando el buffer termina en '}' o ']' para no re-parsear por cada lectura.
+    """
+    buf = bytearray(prefix)
+    decoder = json.JSONDecoder()
+    while True:
+        if _ends_like_json(buf):
+            try:
+                obj, _ = decoder.raw_decode(buf.decode("utf-8").strip())
+                return obj
+            except ValueError:
+                pass
+        if len(buf) > MAX_FRAME_BYTES:
+            raise FrameError(f"Mensaje legacy demasiado grande (máx {MAX_FRAME_BYTES})")
+        data = await reader.read(64 * 1024)
+        if not data:
+            # EOF: último intento, propagando el error de JSON si sigue incompleto
+            return json.loads(buf.decode("utf-8"))
+        buf += data
@@ -1,17 +1,21 @@
 #!/usr/bin/env python3
 import sys
 import json
-import socket
 import os
 from pathlib import Path
 from datetime import datetime
 
+from bridge_client import BridgeConnection, BridgeError
+
 HOST = os.getenv("SOCKET_HOST", "localhost")
 PORT = int(os.getenv("SOCKET_PORT", "7345"))
 
+# Métodos que responde el propio host (no pasan por la extensión ni generan archivo en la cola)
+HOST_METHODS = {"stats"}
+
 def main():
     if len(sys.argv) < 2:
-        print('Uso: cli.py <metodo> [mensaje|archivo] [numero] [--file]')
+        print('Uso: cli.py <metodo> [mensaje|archivo] [numero] [--file] [--stream] [--no-cache] [--priority N]')
         sys.exit(1)
 
     write_to_file = False
@@ -19,6 +23,29 @@ def main():
         write_to_file = True
         sys.argv.remove("--file")
 
+    # Imprime la respuesta a medida que llega (solo send)
+    stream = False
+    if "--stream" in sys.argv:
+        stream = True
+        sys.argv.remove("--stream")
+
+    # Saltar la caché de respuestas del host (si está activada con BRIDGE_CACHE=1)
+    no_cache = False
+    if "--no-cache" in sys.argv:
+        no_cache = True
+        sys.argv.remove("--no-cache")
+
+    # Prioridad dentro de la cola de la pestaña (mayor = antes). Default 0.
+    priority = 0
+    if "--priority" in sys.argv:
+        i = sys.argv.index("--priority")
+        try:
+            priority = int(sys.argv[i + 1])
+        except (IndexError, ValueError):
+            print("--priority debe ir seguido de un número")
+            sys.exit(1)
+        del sys.argv[i:i + 2]
+
     name = sys.argv[1]
     args = []
 
@@ -62,52 +89,82 @@ def main():
                 except Exception:
                     args.append(a)
 
-    payload = {
-        "type": "RUN",
-        "name": name,
-        "args": args,
-    }
-
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(900)
-
     try:
-        s.connect((HOST, PORT))
-    except Exception:
+        conn = BridgeConnection(HOST, PORT)
+    except OSError:
         print(f"⚠️ No se pudo conectar a {HOST}:{PORT}. Probando fallback localhost:7345...")
-        s.connect(("localhost", 7345))
-
-    s.sendall(json.dumps(payload).encode("utf-8"))
+        conn = BridgeConnection("localhost", 7345)
 
-    chunks = []
-    while True:
-        part = s.recv(4096)
-        if not part:
-            break
-        chunks.append(part)
-
-    s.close()
-
-    resp = b"".join(chunks)
-    decoded = resp.decode("utf-8")
+    if name in HOST_METHODS:
+        extra = {"type": "HOST"}
+    else:
+        extra = {"priority": priority} if priority else {}
+        if no_cache:
+            extra["cache"] = False
 
     # Directorio destino (relativo al script)
     output_dir = Path(__file__).parent / ".." / "docker" / "context" / "queque"
     output_dir = output_dir.resolve()
 
-    # Crear directorios si no existen
-    output_dir.mkdir(parents=True, exist_ok=True)
-
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     filename = f"ia_response_{timestamp}.txt"
     filepath = os.path.join(output_dir, filename)
 
+    # En streaming el texto parcial se va escribiendo en <archivo>.partial (el watcher
+    # solo toma *.txt) y se imprime en vivo; al final se deja el .txt completo como siempre.
+    partial = None
+    got_chunks = False
+    if stream and name == "send":
+        output_dir.mkdir(parents=True, exist_ok=True)
+        partial = open(filepath + ".partial", "w", encoding="utf-8")
+
+        def on_chunk(delta):
+            nonlocal got_chunks
+            got_chunks = True
+            partial.write(delta)
+            partial.flush()
+            if not write_to_file:
+                sys.stdout.write(delta)
+                sys.stdout.flush()
+
+        extra["on_chunk"] = on_chunk
+
+    # Conexión persistente con framing (ver bridge_client.py); aquí solo una petición
+    done = False
+    try:
+        res = conn.call(name, args, timeout=900, **extra)
+        done = True
+    except BridgeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+        if partial is not None:
+            partial.close()
+            if not done:
+                # Sin respuesta completa el .partial no sirve: no dejarlo huérfano
+                os.remove(partial.name)
+
+    decoded = json.dumps(res, ensure_ascii=False)
+
+    if name in HOST_METHODS:
+        print(decoded)
+        return
+
+    # Crear directorios si no existen
+    output_dir.mkdir(parents=True, exist_ok=True)
+
     with open(filepath, "w", encoding="utf-8") as f:
         f.write(decoded)
+    if partial is not None:
+        os.remove(partial.name)
 
     if write_to_file:
         with open("response.txt", "w", encoding="utf-8") as f:
             f.write(decoded)
+    elif got_chunks:
+        # El texto ya salió en vivo; solo cerrar la línea
+        print()
     else:
         print(decoded)
 
@@ -3,15 +3,27 @@
 
 import argparse
 import base64
+import bisect
 import json
+import mmap
 import os
+import re
+import sys
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 from typing import List, Optional, Tuple
 
+try:
+    from context_index import ContextIndex, fold, terms_of
+except ImportError:  # python sin sqlite3: se escanea el directorio en cada llamada (y no hay search)
+    ContextIndex = None
+
 
 DEFAULT_DIR = Path("/data/gamegen/context/log")
+# Índice de metadatos; vacío = sin índice. Por defecto al lado del directorio (no dentro:
+# escribir la base de datos ahí cambiaría el mtime del directorio en cada llamada).
+INDEX_DB = os.getenv("CONTEXT_INDEX_DB")
 
 
 def parse_dt(s: Optional[str]) -> Optional[datetime]:
@@ -61,11 +73,19 @@ class FileInfo:
     ftype: str
     size: int
     mtime: float
+    mtime_ns: int = 0
+    ino: int = 0
+    tokens: Optional[int] = None  # tokens aproximados del archivo entero (del índice)
 
     @property
     def dt(self) -> datetime:
         return dt_from_mtime(self.mtime)
 
+    @property
+    def key(self) -> Tuple[int, str]:
+        # Orden de lectura: más antiguo -> más reciente; si hay empate, por nombre
+        return (self.mtime_ns, self.path.name)
+
 
 def scan_files(directory: Path, ftype: Optional[str]) -> List[FileInfo]:
     if not directory.exists():
@@ -80,9 +100,9 @@ def scan_files(directory: Path, ftype: Optional[str]) -> List[FileInfo]:
         if ftype and t != ftype:
             continue
         st = p.stat()
-        files.append(FileInfo(path=p, ftype=t, size=st.st_size, mtime=st.st_mtime))
+        files.append(FileInfo(path=p, ftype=t, size=st.st_size, mtime=st.st_mtime, mtime_ns=st.st_mtime_ns, ino=st.st_ino))
     # Orden: más antiguo -> más reciente (por mtime). Si hay empate, por nombre.
-    files.sort(key=lambda x: (x.mtime, x.path.name))
+    files.sort(key=lambda x: x.key)
     return files
 
 
@@ -98,6 +118,42 @@ def filter_by_time(files: List[FileInfo], since: Optional[datetime], until: Opti
     return out
 
 
+def default_index_path(directory: Path) -> Path:
+    directory = directory.resolve()
+    return directory.parent / f".{directory.name}_index.db"
+
+
+def open_index(args: argparse.Namespace, directory: Path):
+    db_path = args.index if args.index is not None else INDEX_DB
+    if db_path is None:
+        db_path = str(default_index_path(directory))
+    if not db_path or ContextIndex is None:
+        return None
+    try:
+        return ContextIndex(db_path, directory, lambda name: detect_type(Path(name)))
+    except Exception as e:
+        print(f"[context_cli] Índice no disponible ({e}); se escanea el directorio.", file=sys.stderr)
+        return None
+
+
+def list_files(args: argparse.Namespace, index, ftype: Optional[str], since: Optional[datetime], until: Optional[datetime]) -> List[FileInfo]:
+    """Archivos del filtro, ordenados por FileInfo.key. Usa el índice si está disponible."""
+    directory = Path(args.dir)
+    if index is not None:
+        try:
+            since_ns = int(since.timestamp() * 1e9) if since else None
+            until_ns = int(until.timestamp() * 1e9) if until else None
+            index.refresh(args.reindex, ftype, since_ns, until_ns)
+            rows = index.query(ftype, since_ns, until_ns)
+            return [
+                FileInfo(path=directory / name, ftype=t, size=size, mtime=mtime, mtime_ns=mtime_ns, ino=ino, tokens=tokens)
+                for name, t, size, mtime, mtime_ns, ino, tokens in rows
+            ]
+        except Exception as e:
+            print(f"[context_cli] Error en el índice ({e}); se escanea el directorio.", file=sys.stderr)
+    return filter_by_time(scan_files(directory, ftype), since, until)
+
+
 def encode_cursor(obj: dict) -> str:
     raw = json.dumps(obj, ensure_ascii=False).encode("utf-8")
     return base64.urlsafe_b64encode(raw).decode("ascii")
@@ -111,10 +167,84 @@ def decode_cursor(s: str) -> dict:
         raise SystemExit("Cursor inválido. Debe ser un string base64 generado por este script.")
 
 
+def utf8_end(buf, start: int, end: int) -> int:
+    """
+    Ajusta `end` para no partir un carácter UTF-8: retrocede sobre los bytes de
+    continuación (10xxxxxx). Si eso deja el trozo vacío, avanza hasta cerrar el carácter.
+    """
+    if end >= len(buf):
+        return len(buf)
+    pos = end
+    while pos > start and end - pos < 3 and (buf[pos] & 0xC0) == 0x80:
+        pos -= 1
+    if pos > start and (buf[pos] & 0xC0) != 0x80:
+        return pos
+    pos = end
+    while pos < len(buf) and pos - end < 3 and (buf[pos] & 0xC0) == 0x80:
+        pos += 1
+    return pos
+
+
+def read_text_at(path: Path, offset: int, max_chars: int) -> Tuple[str, int, int]:
+    """
+    Lee hasta max_chars caracteres desde el byte `offset` vía mmap, cortando siempre en
+    un límite de carácter UTF-8. Devuelve (texto, nuevo_offset, tamaño_actual).
+    """
+    with path.open("rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if offset >= size or max_chars <= 0:
+            return "", min(offset, size), size
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            parts: List[str] = []
+            remaining = max_chars
+            pos = offset
+            # Cada carácter ocupa al menos 1 byte: pedir `remaining` bytes nunca se pasa;
+            # con acentos/ñ quedan caracteres por pedir y se repite con lo que falta.
+            while remaining > 0 and pos < size:
+                end = utf8_end(mm, pos, pos + remaining)
+                piece = mm[pos:end].decode("utf-8", errors="replace")
+                parts.append(piece)
+                remaining -= len(piece)
+                pos = end
+    return "".join(parts), pos, size
+
+
+def locate(files: List[FileInfo], cur: dict) -> Tuple[int, int]:
+    """
+    Posición (índice, byte) del cursor en la lista actual. Se busca por la clave de orden
+    del archivo (mtime, nombre), no por índice: los archivos nuevos que llegan entre
+    llamadas no desplazan la lectura. Si el archivo ya no es el mismo (otro inode o
+    mtime: fue reemplazado y ahora está más adelante), se sigue en el siguiente desde 0.
+    """
+    if "file_idx" in cur:  # cursor antiguo (índice en la lista)
+        return int(cur.get("file_idx", 0)), int(cur.get("offset", 0))
+    key = (int(cur.get("mtime_ns", 0)), str(cur.get("name", "")))
+    i = bisect.bisect_left([f.key for f in files], key)
+    if i < len(files):
+        f = files[i]
+        if f.key == key and f.ino == int(cur.get("ino", 0)):
+            return i, int(cur.get("offset", 0))
+    return i, 0
+
+
+def cursor_for(f: FileInfo, offset: int, limit: int, limit_key: str = "max_chars") -> str:
+    return encode_cursor({"name": f.path.name, "ino": f.ino, "mtime_ns": f.mtime_ns, "offset": offset, limit_key: limit})
+
+
+def chunk_header(files: List[FileInfo], i: int, size: int, offset: int) -> str:
+    f = files[i]
+    header = f"\n--- FILE {i+1}/{len(files)} | {f.path.name} | {f.dt.isoformat(sep=' ', timespec='seconds')} | {human_size(size)} ---\n"
+    # Si no estamos al inicio del archivo, lo marcamos.
+    if offset > 0:
+        header = header.rstrip("\n") + f" (continuación desde byte {offset}) ---\n"
+    return header
+
+
 def read_chunk(files: List[FileInfo], start_file_idx: int, start_offset: int, max_chars: int) -> Tuple[str, Optional[str]]:
     """
-    Lee texto concatenado desde files[start_file_idx:], comenzando en start_offset del archivo actual,
-    hasta acumular max_chars. Devuelve (texto, next_cursor or None).
+    Lee texto concatenado desde files[start_file_idx:], comenzando en el byte start_offset
+    del archivo actual, hasta acumular max_chars. Devuelve (texto, next_cursor or None).
     """
     remaining = max_chars
     parts: List[str] = []
@@ -123,23 +253,21 @@ def read_chunk(files: List[FileInfo], start_file_idx: int, start_offset: int, ma
 
     while i < len(files) and remaining > 0:
         f = files[i]
-        with f.path.open("r", encoding="utf-8", errors="replace") as fp:
-            fp.seek(offset)
-            # Leemos un poco más de lo necesario para no pasarnos demasiado (aprox).
-            data = fp.read(remaining)
-            new_offset = fp.tell()
+        try:
+            data, new_offset, size = read_text_at(f.path, offset, remaining)
+        except FileNotFoundError:
+            # Borrado entre el listado y la lectura
+            i += 1
+            offset = 0
+            continue
 
         if data:
-            header = f"\n--- FILE {i+1}/{len(files)} | {f.path.name} | {f.dt.isoformat(sep=' ', timespec='seconds')} | {human_size(f.size)} ---\n"
-            # Si no estamos al inicio del archivo, lo marcamos.
-            if offset > 0:
-                header = header.rstrip("\n") + f" (continuación desde byte {offset}) ---\n"
-            parts.append(header)
+            parts.append(chunk_header(files, i, size, offset))
             parts.append(data)
             remaining -= len(data)
 
         # Si terminamos archivo (offset llegó al tamaño) pasamos al siguiente
-        if new_offset >= f.size:
+        if new_offset >= size:
             i += 1
             offset = 0
         else:
@@ -149,15 +277,150 @@ def read_chunk(files: List[FileInfo], start_file_idx: int, start_offset: int, ma
 
     text = "".join(parts).strip("\n")
 
-    if not text:
+    if not parts:
         return "", None
 
     if i >= len(files) and offset == 0:
         # Consumimos todo
         return text, None
 
-    next_cursor = encode_cursor({"file_idx": i, "offset": offset, "max_chars": max_chars})
-    return text, next_cursor
+    return text, cursor_for(files[i], offset, max_chars)
+
+
+# -----------------------------
+# TOKENS (aproximados)
+# -----------------------------
+# Aproximación local de un tokenizador BPE (sin red ni dependencias): cada trozo es
+# ~1 token. Palabras ASCII en trozos de hasta 5 letras, letras no ASCII (á, ñ, ...)
+# de a 2, números de a 3 cifras, cada signo suelto y cada corrida de 2+ espacios.
+# Los espacios simples van pegados a la palabra siguiente, como en los BPE reales.
+# Tiende a contar algo de más: es preferible a pasarse de la ventana del modelo.
+TOKEN_RE = re.compile(r"[A-Za-z]{1,5}|[^\W\dA-Za-z_]{1,2}|\d{1,3}|[^\w\s]|_|\s{2,}|\n")
+# Tope de bytes que se decodifican de una vez al buscar el corte (líneas enormes)
+TOKEN_LINE_BYTES = 64 * 1024
+
+
+def count_tokens(text: str) -> int:
+    return len(TOKEN_RE.findall(text))
+
+
+def display(text: str) -> str:
+    # Se decodifica con surrogateescape para contar bytes exactos; al mostrar, U+FFFD
+    return text.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+
+
+def cut_tokens(line: str, budget: int) -> str:
+    """Prefijo de `line` con como mucho `budget` tokens (corte entre tokens)."""
+    for n, m in enumerate(TOKEN_RE.finditer(line)):
+        if n == budget:
+            return line[: m.start()]
+    return line
+
+
+def read_tokens_at(path: Path, offset: int, budget: int, force: bool) -> Tuple[str, int, int, int]:
+    """
+    Lee desde el byte `offset` hasta `budget` tokens, cortando en fin de párrafo (línea
+    en blanco) o, si no hay uno cerca, en fin de línea. Una línea que sola no entra se
+    corta entre tokens solo si `force` (no hay nada más en el chunk); si no, se deja
+    para el siguiente. Devuelve (texto, nuevo_offset, tamaño_actual, tokens_usados).
+    """
+    with path.open("rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if offset >= size or budget <= 0:
+            return "", min(offset, size), size, 0
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            parts: List[str] = []
+            pos = offset
+            used = 0
+            para = None  # (n_parts, pos, used) tras la última línea en blanco
+            while pos < size:
+                nl = mm.find(b"\n", pos, pos + TOKEN_LINE_BYTES)
+                end = nl + 1 if nl >= 0 else utf8_end(mm, pos, pos + TOKEN_LINE_BYTES)
+                line = mm[pos:end].decode("utf-8", "surrogateescape")
+                n = count_tokens(line)
+                if used + n > budget:
+                    if not parts and force:
+                        line = cut_tokens(line, budget - used)
+                        parts.append(line)
+                        used = budget
+                        pos += len(line.encode("utf-8", "surrogateescape"))
+                    elif para is not None and para[2] * 2 >= used:
+                        # Mejor cortar en el último párrafo si no se pierde más de la mitad
+                        del parts[para[0]:]
+                        pos, used = para[1], para[2]
+                    break
+                parts.append(line)
+                used += n
+                pos = end
+                if not line.strip():
+                    para = (len(parts), pos, used)
+    return "".join(parts), pos, size, used
+
+
+def read_chunk_tokens(files: List[FileInfo], start_file_idx: int, start_offset: int, max_tokens: int, index=None) -> Tuple[str, Optional[str]]:
+    """
+    Como read_chunk, pero el límite es de tokens (cabeceras incluidas). Si el índice ya
+    conoce los tokens de un archivo entero y entran, se toma sin volver a tokenizarlo;
+    si se cuenta un archivo entero por primera vez, se guarda en el índice.
+    """
+    remaining = max_tokens
+    parts: List[str] = []
+    i = start_file_idx
+    offset = start_offset
+
+    while i < len(files) and remaining > 0:
+        f = files[i]
+        try:
+            size = f.path.stat().st_size
+        except FileNotFoundError:
+            i += 1
+            offset = 0
+            continue
+        header = chunk_header(files, i, size, offset)
+        budget = remaining - count_tokens(header)
+        if budget <= 0 and parts:
+            break
+        budget = max(budget, 1)
+
+        whole = offset == 0 and f.tokens is not None and size == f.size
+        if whole and f.tokens <= budget:
+            data, new_offset, size = read_text_at(f.path, 0, size)
+            used = f.tokens
+        else:
+            try:
+                data, new_offset, size, used = read_tokens_at(f.path, offset, budget, force=not parts)
+            except FileNotFoundError:
+                i += 1
+                offset = 0
+                continue
+            if offset == 0 and new_offset >= size and f.tokens is None and index is not None:
+                try:
+                    index.set_tokens(f.path.name, f.ino, f.mtime_ns, used)
+                except Exception:
+                    pass  # la caché de tokens es opcional
+
+        if data:
+            parts.append(header)
+            parts.append(display(data))
+            remaining -= count_tokens(header) + used
+
+        if new_offset >= size:
+            i += 1
+            offset = 0
+        else:
+            offset = new_offset
+            break
+
+    text = "".join(parts).strip("\n")
+
+    if not parts:
+        return "", None
+
+    if i >= len(files) and offset == 0:
+        return text, None
+
+    return text, cursor_for(files[i], offset, max_tokens, "max_tokens")
 
 
 def cmd_files(args: argparse.Namespace) -> None:
@@ -166,8 +429,14 @@ def cmd_files(args: argparse.Namespace) -> None:
     since = parse_dt(args.since)
     until = parse_dt(args.until)
 
-    files = scan_files(directory, ftype)
-    files = filter_by_time(files, since, until)
+    if not directory.exists():
+        raise SystemExit(f"No existe la ruta: {directory.resolve()}")
+    index = open_index(args, directory)
+    try:
+        files = list_files(args, index, ftype, since, until)
+    finally:
+        if index is not None:
+            index.close()
 
     if not files:
         print("No hay archivos que coincidan con el filtro.")
@@ -188,9 +457,20 @@ def cmd_get(args: argparse.Namespace) -> None:
     since = parse_dt(args.since)
     until = parse_dt(args.until)
     max_chars = int(args.max_chars)
+    max_tokens = int(args.max_tokens) if args.max_tokens else None
 
-    files = scan_files(directory, ftype)
-    files = filter_by_time(files, since, until)
+    if not directory.exists():
+        raise SystemExit(f"No existe la ruta: {directory.resolve()}")
+    index = open_index(args, directory)
+    try:
+        get_chunk(args, index, directory, ftype, since, until, max_chars, max_tokens)
+    finally:
+        if index is not None:
+            index.close()
+
+
+def get_chunk(args, index, directory, ftype, since, until, max_chars, max_tokens) -> None:
+    files = list_files(args, index, ftype, since, until)
 
     if not files:
         print("No hay archivos que coincidan con el filtro.")
@@ -199,16 +479,18 @@ def cmd_get(args: argparse.Namespace) -> None:
     # Cursor opcional
     if args.cursor:
         cur = decode_cursor(args.cursor)
-        file_idx = int(cur.get("file_idx", 0))
-        offset = int(cur.get("offset", 0))
+        file_idx, offset = locate(files, cur)
         # Si el cursor trae max_chars, respetamos el que venga por CLI.
     else:
         file_idx = 0
         offset = 0
 
-    text, next_cursor = read_chunk(files, file_idx, offset, max_chars)
+    if max_tokens:
+        text, next_cursor = read_chunk_tokens(files, file_idx, offset, max_tokens, index)
+    else:
+        text, next_cursor = read_chunk(files, file_idx, offset, max_chars)
 
-    if not text:
+    if not text and not next_cursor:
         print("No se encontró texto para devolver (o el cursor ya está al final).")
         return
 
@@ -223,11 +505,109 @@ def cmd_get(args: argparse.Namespace) -> None:
         print("=" * 70)
 
 
+# -----------------------------
+# SEARCH
+# -----------------------------
+SNIPPET_CHARS = 240
+# Ocurrencias que se miran como máximo para elegir el fragmento
+SNIPPET_MAX_HITS = 2000
+
+
+def find_snippet(path: Path, terms: List[str]) -> Optional[Tuple[int, int, str]]:
+    """
+    Fragmento alrededor de la zona con más términos distintos de la búsqueda.
+    Devuelve (byte del hit, byte de inicio de su línea, fragmento) o None.
+    """
+    with path.open("rb") as fp:
+        text = fp.read().decode("utf-8", "surrogateescape")
+    # fold() conserva las posiciones: lo encontrado en `folded` vale para `text`
+    folded = fold(text)
+    alts = "|".join(re.escape(t) for t in sorted(set(terms), key=len, reverse=True))
+    hits = []
+    for m in re.finditer(rf"\b(?:{alts})\b", folded):
+        hits.append((m.start(), m.group()))
+        if len(hits) >= SNIPPET_MAX_HITS:
+            break
+    if not hits:
+        return None
+    best_pos, best_n = hits[0][0], 0
+    for i, (pos, _) in enumerate(hits):
+        distinct = set()
+        for p, t in hits[i:]:
+            if p >= pos + SNIPPET_CHARS // 2:
+                break
+            distinct.add(t)
+        if len(distinct) > best_n:
+            best_pos, best_n = pos, len(distinct)
+    start = max(0, best_pos - SNIPPET_CHARS // 4)
+    # No empezar a mitad de palabra
+    while start > 0 and not text[start - 1].isspace() and best_pos - start < SNIPPET_CHARS // 2:
+        start -= 1
+    snippet = " ".join(display(text[start:start + SNIPPET_CHARS]).split())
+    if start > 0:
+        snippet = "…" + snippet
+    if start + SNIPPET_CHARS < len(text):
+        snippet += "…"
+    hit_byte = len(text[:best_pos].encode("utf-8", "surrogateescape"))
+    line_start = text.rfind("\n", 0, best_pos) + 1
+    line_byte = len(text[:line_start].encode("utf-8", "surrogateescape"))
+    return hit_byte, line_byte, snippet
+
+
+def cmd_search(args: argparse.Namespace) -> None:
+    directory = Path(args.dir)
+    since = parse_dt(args.since)
+    until = parse_dt(args.until)
+    if not directory.exists():
+        raise SystemExit(f"No existe la ruta: {directory.resolve()}")
+    index = open_index(args, directory)
+    if index is None:
+        raise SystemExit("search necesita el índice (sqlite3 y --index no vacío).")
+    terms = terms_of(args.query)
+    try:
+        if not terms:
+            raise SystemExit("La búsqueda no tiene palabras (mínimo 2 letras o cifras).")
+        since_ns = int(since.timestamp() * 1e9) if since else None
+        until_ns = int(until.timestamp() * 1e9) if until else None
+        index.refresh(args.reindex, args.type, since_ns, until_ns)
+        added = index.index_pending()
+        if added:
+            print(f"[context_cli] Indexados {added} archivo(s) nuevos.", file=sys.stderr)
+        rows = index.search(terms, args.type, since_ns, until_ns, limit=int(args.limit))
+    finally:
+        index.close()
+
+    if not rows:
+        print("Sin resultados.")
+        return
+
+    print(f"Búsqueda: {args.query}")
+    print(f"Resultados: {len(rows)}\n")
+    for n, (score, name, t, size, mtime, mtime_ns, ino) in enumerate(rows, 1):
+        f = FileInfo(path=directory / name, ftype=t, size=size, mtime=mtime, mtime_ns=mtime_ns, ino=ino)
+        try:
+            found = find_snippet(f.path, terms)
+        except FileNotFoundError:
+            found = None
+        print(f"#{n} | {name} | {t} | {f.dt.isoformat(sep=' ', timespec='seconds')} | {human_size(size)} | score {score:.2f}")
+        if found is None:
+            print("   (el archivo cambió desde que se indexó; usar --reindex)")
+            print()
+            continue
+        hit_byte, line_byte, snippet = found
+        print(f"   byte {hit_byte}: {snippet}")
+        # El cursor lleva a `get` al inicio de la línea del hit
+        print(f"   get --type {t} --cursor {cursor_for(f, line_byte, 12000)}")
+        print()
+
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(
         description="CLI para listar y consumir contexto (human/log) en chunks con cursor."
     )
     p.add_argument("--dir", default=str(DEFAULT_DIR), help="Directorio de contexto (default: /data/gamegen/context/log)")
+    p.add_argument("--index", default=None, help="Base de datos del índice (default: .<dir>_index.db junto al directorio; '' = sin índice)")
+    p.add_argument("--reindex", action="store_true", help="Reconstruir el índice desde cero antes de responder")
 
     sub = p.add_subparsers(dest="cmd", required=True)
 
@@ -241,10 +621,20 @@ def build_parser() -> argparse.ArgumentParser:
     p_get.add_argument("--type", choices=["human", "log"], required=True, help="Tipo de contexto a leer")
     p_get.add_argument("--since", default=None, help="Desde (YYYY-MM-DD o YYYY-MM-DDTHH:MM[:SS])")
     p_get.add_argument("--until", default=None, help="Hasta (YYYY-MM-DD o YYYY-MM-DDTHH:MM[:SS])")
-    p_get.add_argument("--max-chars", default="12000", help="Máximo de caracteres a devolver (default: 12000)")
+    limit = p_get.add_mutually_exclusive_group()
+    limit.add_argument("--max-chars", default="12000", help="Máximo de caracteres a devolver (default: 12000)")
+    limit.add_argument("--max-tokens", default=None, help="Máximo de tokens (aproximados, cabeceras incluidas); corta en párrafo o línea")
     p_get.add_argument("--cursor", default=None, help="Cursor para continuar (lo imprime el comando get)")
     p_get.set_defaults(func=cmd_get)
 
+    p_search = sub.add_parser("search", help="Buscar texto (ranking BM25) y dar un cursor para get")
+    p_search.add_argument("query", help="Palabras a buscar (sin distinguir mayúsculas ni acentos)")
+    p_search.add_argument("--type", choices=["human", "log"], default=None, help="Filtrar por tipo")
+    p_search.add_argument("--since", default=None, help="Desde (YYYY-MM-DD o YYYY-MM-DDTHH:MM[:SS])")
+    p_search.add_argument("--until", default=None, help="Hasta (YYYY-MM-DD o YYYY-MM-DDTHH:MM[:SS])")
+    p_search.add_argument("--limit", default="5", help="Máximo de resultados (default: 5)")
+    p_search.set_defaults(func=cmd_search)
+
     return p
 
 
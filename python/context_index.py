@@ -0,0 +1,332 @@
+# context_index.py
+"""
+Índice persistente de metadatos para context_cli (SQLite en modo WAL).
+
+En vez de hacer iterdir() + stat() de todos los archivos en cada llamada, se guarda
+(nombre, tipo, tamaño, mtime, inode) y solo se refresca cuando cambia el mtime del
+directorio (crear, borrar o renombrar archivos lo actualiza; el watcher escribe con
+os.replace, así que reescribir un archivo también).
+
+- Refresco incremental: os.scandir() da el inode sin stat(); solo se hace stat() de
+  los archivos nuevos o reemplazados (inode distinto) y se borran los que ya no están.
+- Consultas por rango de tiempo sobre un índice (ftype, mtime_ns, name): sin leer ni
+  convertir a datetime los archivos que quedan fuera del rango.
+- Guarda también el número (aproximado) de tokens de cada archivo una vez contado;
+  se pierde solo si el archivo se reemplaza (la fila se reescribe con tokens NULL).
+- Búsqueda de texto: índice invertido (término -> archivo, frecuencia) que se llena de
+  forma incremental con los archivos aún no indexados; ranking BM25. Los términos se
+  normalizan con fold(): minúsculas y sin acentos ("Función" == "funcion").
+- Es una caché reconstruible: si cambia SCHEMA_VERSION se borra y se vuelve a llenar.
+- Si un archivo se reescribe "en sitio" (`>` o append, mismo nombre e inode) el mtime
+  del directorio no cambia: por eso refresh() hace además stat() de las filas del rango
+  que se va a consultar y reescribe las que cambiaron. Un archivo reescrito en sitio
+  que queda fuera de ese rango solo se ve con `--reindex`.
+"""
+import math
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+
+# Si el mtime del directorio es así de reciente no se da por bueno: en sistemas de
+# archivos con resolución de 1s un cambio en el mismo segundo no lo movería.
+FRESH_GUARD_SECONDS = 2.0
+
+SCHEMA_VERSION = 4
+
+TERM_RE = re.compile(r"\w{2,64}")
+# Archivos indexados por transacción (no bloquear a otros CLIs mucho rato)
+INDEX_BATCH = 200
+# Parámetros estándar de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class _Fold(dict):
+    # Un carácter -> un carácter (las posiciones no cambian): base sin acento, minúscula
+    def __missing__(self, code):
+        base = unicodedata.normalize("NFD", chr(code))[0].lower()
+        self[code] = base = base if len(base) == 1 else chr(code)
+        return base
+
+
+_FOLD = _Fold()
+
+
+def fold(text: str) -> str:
+    return text.translate(_FOLD)
+
+
+def terms_of(text: str):
+    return TERM_RE.findall(fold(text))
+
+
+class ContextIndex:
+    def __init__(self, db_path, directory, classify):
+        """classify(nombre) -> tipo ("human"/"log") o None si el archivo no cuenta."""
+        self.directory = os.path.abspath(str(directory))
+        self.classify = classify
+        os.makedirs(os.path.dirname(os.path.abspath(str(db_path))), exist_ok=True)
+        # isolation_level=None: las transacciones se abren a mano con BEGIN IMMEDIATE
+        self.db = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with self._tx():
+                self.db.execute("DROP TABLE IF EXISTS postings")
+                self.db.execute("DROP TABLE IF EXISTS files")
+                self.db.execute("DROP TABLE IF EXISTS meta")
+                self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " dir TEXT NOT NULL, key TEXT NOT NULL, value TEXT, PRIMARY KEY (dir, key))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " id INTEGER PRIMARY KEY, dir TEXT NOT NULL, name TEXT NOT NULL, ftype TEXT NOT NULL,"
+            " size INTEGER NOT NULL, mtime REAL NOT NULL, mtime_ns INTEGER NOT NULL, ino INTEGER NOT NULL,"
+            " tokens INTEGER, terms INTEGER, UNIQUE (dir, name))"
+        )
+        # terms: nº de términos del archivo (largo para BM25); NULL = aún no indexado
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, doc))"
+            " WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc)")
+        # Archivo borrado o reemplazado: fuera sus términos
+        self.db.execute(
+            "CREATE TRIGGER IF NOT EXISTS files_gone AFTER DELETE ON files"
+            " BEGIN DELETE FROM postings WHERE doc = old.id; END"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_type_time ON files(dir, ftype, mtime_ns, name)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_time ON files(dir, mtime_ns, name)")
+
+    # ---------- transacciones ----------
+    @contextmanager
+    def _tx(self):
+        self.db.execute("BEGIN IMMEDIATE")  # dos CLIs refrescando a la vez se serializan
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        else:
+            self.db.execute("COMMIT")
+
+    def _meta(self, key):
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE dir = ? AND key = ?", (self.directory, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute(
+            "INSERT OR REPLACE INTO meta(dir, key, value) VALUES (?, ?, ?)", (self.directory, key, value)
+        )
+
+    # ---------- refresco ----------
+    def refresh(self, force=False, ftype=None, since=None, until=None):
+        """
+        Sincroniza el índice con el directorio. ftype/since/until: el rango que se
+        va a consultar (como en query); sus filas se comprueban con stat() aunque el
+        directorio no haya cambiado. Devuelve (añadidos, actualizados, borrados).
+        """
+        st = os.stat(self.directory)
+        stamp = str(st.st_mtime_ns)
+        added = updated = gone = 0
+        if force or self._meta("dir_mtime_ns") != stamp:
+            added, updated, gone = self._rescan(force, st, stamp)
+        if not force:
+            stale, missing = self._recheck(ftype, since, until)
+            updated += stale
+            gone += missing
+        return added, updated, gone
+
+    def _rescan(self, force, st, stamp):
+        with self._tx():
+            if force:
+                self.db.execute("DELETE FROM files WHERE dir = ?", (self.directory,))
+            known = dict(
+                self.db.execute("SELECT name, ino FROM files WHERE dir = ?", (self.directory,)).fetchall()
+            )
+            added = updated = 0
+            seen = set()
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    ftype = self.classify(entry.name)
+                    if not ftype:
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        ino = entry.inode()
+                        seen.add(entry.name)
+                        if known.get(entry.name) == ino:
+                            continue
+                        est = entry.stat()
+                    except FileNotFoundError:
+                        seen.discard(entry.name)
+                        continue
+                    if entry.name in known:
+                        # DELETE explícito (no INSERT OR REPLACE) para que salte el trigger
+                        self.db.execute("DELETE FROM files WHERE dir = ? AND name = ?", (self.directory, entry.name))
+                    self.db.execute(
+                        "INSERT INTO files(dir, name, ftype, size, mtime, mtime_ns, ino)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (self.directory, entry.name, ftype, est.st_size, est.st_mtime, est.st_mtime_ns, ino),
+                    )
+                    if entry.name in known:
+                        updated += 1
+                    else:
+                        added += 1
+            gone = [name for name in known if name not in seen]
+            self.db.executemany(
+                "DELETE FROM files WHERE dir = ? AND name = ?", [(self.directory, n) for n in gone]
+            )
+            # Se guarda el mtime leído ANTES de listar: si algo cambió mientras tanto,
+            # la próxima llamada lo verá distinto y vuelve a refrescar.
+            fresh = time.time() - st.st_mtime < FRESH_GUARD_SECONDS
+            self._set_meta("dir_mtime_ns", "" if fresh else stamp)
+        return added, updated, len(gone)
+
+    def _recheck(self, ftype, since, until):
+        """
+        stat() de las filas del rango: un archivo reescrito en sitio (mismo inode) no
+        cambia el mtime del directorio y _rescan lo da por conocido. Las filas que
+        cambiaron se reescriben (tokens y términos a NULL; el trigger borra sus
+        postings) y las de archivos que ya no existen se borran.
+        Devuelve (actualizadas, borradas).
+        """
+        stale, gone = [], []
+        for name, ftype_, size, _, mtime_ns, ino, _ in self.query(ftype, since, until):
+            try:
+                est = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                gone.append(name)
+                continue
+            if (est.st_size, est.st_mtime_ns, est.st_ino) != (size, mtime_ns, ino):
+                stale.append((name, ftype_, est))
+        if stale or gone:
+            with self._tx():
+                self.db.executemany(
+                    "DELETE FROM files WHERE dir = ? AND name = ?",
+                    [(self.directory, n) for n in gone] + [(self.directory, n) for n, _, _ in stale],
+                )
+                self.db.executemany(
+                    "INSERT INTO files(dir, name, ftype, size, mtime, mtime_ns, ino)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (self.directory, n, t, est.st_size, est.st_mtime, est.st_mtime_ns, est.st_ino)
+                        for n, t, est in stale
+                    ],
+                )
+        return len(stale), len(gone)
+
+    # ---------- consultas ----------
+    def query(self, ftype=None, since=None, until=None):
+        """
+        Filas (name, ftype, size, mtime, mtime_ns, ino, tokens) ordenadas por (mtime_ns, name).
+        since/until: timestamps en ns (inclusive); None = sin límite.
+        """
+        sql = "SELECT name, ftype, size, mtime, mtime_ns, ino, tokens FROM files WHERE dir = ?"
+        params = [self.directory]
+        if ftype:
+            sql += " AND ftype = ?"
+            params.append(ftype)
+        if since is not None:
+            sql += " AND mtime_ns >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND mtime_ns <= ?"
+            params.append(until)
+        sql += " ORDER BY mtime_ns, name"
+        return self.db.execute(sql, params).fetchall()
+
+    def set_tokens(self, name, ino, mtime_ns, tokens):
+        # Solo si la fila sigue siendo el mismo archivo que se contó
+        self.db.execute(
+            "UPDATE files SET tokens = ? WHERE dir = ? AND name = ? AND ino = ? AND mtime_ns = ?",
+            (tokens, self.directory, name, ino, mtime_ns),
+        )
+
+    # ---------- búsqueda ----------
+    def index_pending(self):
+        """Indexa los términos de los archivos que aún no lo están. Devuelve cuántos."""
+        pending = self.db.execute(
+            "SELECT id, name, ino FROM files WHERE dir = ? AND terms IS NULL", (self.directory,)
+        ).fetchall()
+        done = 0
+        for start in range(0, len(pending), INDEX_BATCH):
+            with self._tx():
+                for doc, name, ino in pending[start:start + INDEX_BATCH]:
+                    path = os.path.join(self.directory, name)
+                    try:
+                        with open(path, "rb") as fp:
+                            if os.fstat(fp.fileno()).st_ino != ino:
+                                continue  # reemplazado: lo verá el próximo refresh
+                            text = fp.read().decode("utf-8", "replace")
+                    except FileNotFoundError:
+                        continue
+                    counts = Counter(terms_of(text))
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO postings(term, doc, tf) VALUES (?, ?, ?)",
+                        [(term, doc, tf) for term, tf in counts.items()],
+                    )
+                    self.db.execute(
+                        "UPDATE files SET terms = ? WHERE id = ?", (sum(counts.values()), doc)
+                    )
+                    done += 1
+        return done
+
+    def search(self, query_terms, ftype=None, since=None, until=None, limit=10):
+        """
+        BM25 sobre los archivos indexados que cumplen el filtro. Devuelve filas
+        (score, name, ftype, size, mtime, mtime_ns, ino) de mayor a menor score.
+        """
+        where = "f.dir = ? AND f.terms IS NOT NULL"
+        params = [self.directory]
+        if ftype:
+            where += " AND f.ftype = ?"
+            params.append(ftype)
+        if since is not None:
+            where += " AND f.mtime_ns >= ?"
+            params.append(since)
+        if until is not None:
+            where += " AND f.mtime_ns <= ?"
+            params.append(until)
+        n_docs, avg_len = self.db.execute(
+            f"SELECT COUNT(*), AVG(f.terms) FROM files f WHERE {where}", params
+        ).fetchone()
+        if not n_docs:
+            return []
+        avg_len = max(avg_len or 0.0, 1.0)
+        scores = {}
+        for term in set(query_terms):
+            rows = self.db.execute(
+                f"SELECT p.doc, p.tf, f.terms FROM postings p JOIN files f ON f.id = p.doc"
+                f" WHERE p.term = ? AND {where}",
+                [term] + params,
+            ).fetchall()
+            if not rows:
+                continue
+            idf = math.log((n_docs - len(rows) + 0.5) / (len(rows) + 0.5) + 1.0)
+            for doc, tf, length in rows:
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        top = sorted(scores.items(), key=lambda kv: -kv[1])[:limit]
+        out = []
+        for doc, score in top:
+            row = self.db.execute(
+                "SELECT name, ftype, size, mtime, mtime_ns, ino FROM files WHERE id = ?", (doc,)
+            ).fetchone()
+            out.append((score,) + tuple(row))
+        return out
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
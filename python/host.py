@@ -1,18 +1,33 @@
 # host.py
-import sys, json, struct, socket, threading, queue, os, platform, time, traceback, logging
-from logging.handlers import RotatingFileHandler
+import sys, json, struct, socket, threading, asyncio, os, platform, time, traceback, logging, heapq, itertools, queue
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from bridge_cache import cache_from_env
+from bridge_protocol import (
+    HEADER, FrameError, encode_frame, is_legacy_header,
+    read_header_async, recv_frame_payload_async, recv_legacy_json_async,
+)
 
 # =========================
 #  Configuración de logging
+#  BRIDGE_LOG_LEVEL: DEBUG/INFO/WARNING/ERROR (default INFO). En WARNING los
+#  mensajes por petición ni siquiera construyen su preview.
+#  BRIDGE_LOG_ASYNC=0 desactiva el modo cola (escritura síncrona en el hilo que loguea).
 # =========================
+LOG_LEVEL = os.getenv("BRIDGE_LOG_LEVEL", "INFO").upper()
+LOG_ASYNC = os.getenv("BRIDGE_LOG_ASYNC", "1") != "0"
+_log_listener = None
+
 def setup_logger():
+    global _log_listener
     base_dir = os.path.dirname(os.path.abspath(__file__))
     log_dir = os.path.join(base_dir, "logs")
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, "host.log")
 
     logger = logging.getLogger("cli_bridge")
-    logger.setLevel(logging.INFO)
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
 
     # Evitar handlers duplicados si el script se recarga
     if not logger.handlers:
@@ -22,12 +37,24 @@ def setup_logger():
             datefmt="%Y-%m-%d %H:%M:%S"
         )
         fh.setFormatter(fmt)
-        logger.addHandler(fh)
+        if LOG_ASYNC:
+            # El hot path solo encola el record; un hilo aparte escribe y rota el archivo
+            log_queue = queue.SimpleQueue()
+            logger.addHandler(QueueHandler(log_queue))
+            _log_listener = QueueListener(log_queue, fh, respect_handler_level=True)
+            _log_listener.start()
+        else:
+            logger.addHandler(fh)
 
     # No propagar al root para evitar que algo imprima a stderr
     logger.propagate = False
     return logger
 
+def stop_logging():
+    """Vacía la cola de logs. Llamar antes de os._exit (que no ejecuta atexit)."""
+    if _log_listener is not None:
+        _log_listener.stop()
+
 LOG = setup_logger()
 
 def log_env_info():
@@ -43,7 +70,13 @@ def log_env_info():
 #  Utilidades de Native Messaging (STDIO)
 #  ¡Nunca usar print()! Solo usar write_message con framing.
 # ==========================================
+def decode_native_message(data):
+    obj = json.loads(data.decode('utf-8'))
+    LOG.info("Desde EXTENSIÓN (STDIO) <= %s", LazyPreview(obj))
+    return obj
+
 def read_message():
+    """Lectura bloqueante (hilo lector en Windows, donde STDIN no admite I/O asíncrona)."""
     try:
         raw_len = sys.stdin.buffer.read(4)
         if not raw_len or len(raw_len) < 4:
@@ -54,9 +87,21 @@ def read_message():
         if not data or len(data) < msg_len:
             LOG.warning("STDIN datos insuficientes: esperados=%d, leídos=%d", msg_len, 0 if not data else len(data))
             return None
-        obj = json.loads(data.decode('utf-8'))
-        LOG.info("Desde EXTENSIÓN (STDIO) <= %s", safe_preview_json(obj))
-        return obj
+        return decode_native_message(data)
+    except Exception:
+        LOG.exception("Error leyendo mensaje desde EXTENSIÓN (STDIO).")
+        return None
+
+async def read_message_async(reader):
+    """Misma semántica que read_message, sobre un asyncio.StreamReader conectado a STDIN."""
+    try:
+        raw_len = await reader.readexactly(4)
+        msg_len = struct.unpack('<I', raw_len)[0]
+        data = await reader.readexactly(msg_len)
+        return decode_native_message(data)
+    except asyncio.IncompleteReadError as e:
+        LOG.warning("STDIN cerrado o datos insuficientes: esperados=%s, leídos=%d", e.expected, len(e.partial))
+        return None
     except Exception:
         LOG.exception("Error leyendo mensaje desde EXTENSIÓN (STDIO).")
         return None
@@ -67,130 +112,519 @@ def write_message(msg_obj):
         sys.stdout.buffer.write(struct.pack('<I', len(data)))
         sys.stdout.buffer.write(data)
         sys.stdout.buffer.flush()
-        LOG.info("Hacia EXTENSIÓN (STDIO) => %s", safe_preview_json(msg_obj))
+        LOG.info("Hacia EXTENSIÓN (STDIO) => %s", LazyPreview(msg_obj))
     except Exception:
         LOG.exception("Error escribiendo mensaje hacia EXTENSIÓN (STDIO).")
 
+# Un solo hilo escribe en STDOUT: conserva el orden y el loop nunca bloquea en el pipe
+_stdout_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="STDOUT")
+
+def post_to_extension(msg_obj):
+    _stdout_executor.submit(write_message, msg_obj)
+
 def safe_preview_json(obj, max_len=500):
+    """
+    Preview JSON acotado a max_len. Recorre el objeto recortando strings largos en
+    vez de serializarlo entero (un prompt de varios MB no se re-serializa para el log).
+    Para objetos pequeños el resultado es idéntico a json.dumps(obj, ensure_ascii=False).
+    """
     try:
-        s = json.dumps(obj, ensure_ascii=False)
+        parts = []
+        _preview_into(obj, parts, [max_len + 1])
+        s = "".join(parts)
         return s if len(s) <= max_len else s[:max_len] + "...(trunc)"
     except Exception:
         return "<unserializable>"
 
+def _preview_into(obj, parts, budget):
+    if budget[0] <= 0:
+        return
+    if isinstance(obj, str):
+        chunk = json.dumps(obj[:budget[0]], ensure_ascii=False)
+    elif isinstance(obj, dict):
+        parts.append("{")
+        budget[0] -= 1
+        for i, (k, v) in enumerate(obj.items()):
+            if budget[0] <= 0:
+                return
+            key = json.dumps(k if isinstance(k, str) else str(k), ensure_ascii=False)
+            head = (", " if i else "") + key + ": "
+            parts.append(head)
+            budget[0] -= len(head)
+            _preview_into(v, parts, budget)
+        parts.append("}")
+        budget[0] -= 1
+        return
+    elif isinstance(obj, (list, tuple)):
+        parts.append("[")
+        budget[0] -= 1
+        for i, v in enumerate(obj):
+            if budget[0] <= 0:
+                return
+            if i:
+                parts.append(", ")
+                budget[0] -= 2
+            _preview_into(v, parts, budget)
+        parts.append("]")
+        budget[0] -= 1
+        return
+    else:
+        chunk = json.dumps(obj, ensure_ascii=False)
+    parts.append(chunk)
+    budget[0] -= len(chunk)
+
+class LazyPreview:
+    """Argumento de logging: el preview solo se calcula si el nivel está habilitado."""
+    __slots__ = ("obj", "max_len")
+
+    def __init__(self, obj, max_len=500):
+        self.obj = obj
+        self.max_len = max_len
+
+    def __str__(self):
+        return safe_preview_json(self.obj, self.max_len)
+
 # =======================
 #  Puente TCP (CLI <-> Host)
+#  Todo vive en un único event loop: cada petición en vuelo es un Future en `pending`.
 # =======================
 HOST = "0.0.0.0"
 PORT = 7345
+REQUEST_TIMEOUT = 15 * 60  # segundos esperando respuesta de la extensión
+# Lo que la extensión espera como mucho una respuesta de la pestaña (900_000 ms en
+# channel.js): pasado esto ya no va a responder y la pestaña se puede volver a usar.
+EXTENSION_TIMEOUT = 900
+
+class PendingRequest:
+    """
+    Entrada de `pending`: el Future que resuelve la respuesta y la conexión dueña.
+    `on_chunk` (modo streaming) recibe los mensajes parciales {id, type: "CHUNK", delta}.
+    """
+    __slots__ = ("req_id", "future", "owner", "on_chunk")
+
+    def __init__(self, req_id, future, owner, on_chunk=None):
+        self.req_id = req_id
+        self.future = future
+        self.owner = owner
+        self.on_chunk = on_chunk
 
 pending = {}
-pending_lock = threading.Lock()
 
-def tcp_client_handler(conn, addr):
-    thread_name = threading.current_thread().name
-    LOG.info("Conexión TCP aceptada desde %s:%s (thread=%s)", addr[0], addr[1], thread_name)
-    req_id = None
-    try:
-        buf = conn.recv(900_000_000)
-        if not buf:
-            LOG.warning("Conexión vacía desde %s:%s", addr[0], addr[1])
+def response_text(res):
+    """Texto de la respuesta de `send` ({res: {body}}), o None si no lo hay."""
+    inner = res.get("res")
+    body = inner.get("body") if isinstance(inner, dict) else None
+    return body if isinstance(body, str) else None
+
+def deliver_from_extension(msg):
+    """Corre en el loop: resuelve el Future del id que responde la extensión."""
+    req_id = msg.get("id")
+    if not req_id:
+        LOG.warning("Mensaje desde EXTENSIÓN sin 'id': %s", LazyPreview(msg))
+        return
+
+    if msg.get("type") == "CHUNK":
+        # Respuesta parcial: se reenvía tal cual sin cerrar la petición
+        entry = pending.get(req_id)
+        if entry and entry.on_chunk:
+            entry.on_chunk(msg)
+        return
+
+    # La pestaña queda libre aunque el cliente ya no esté esperando
+    scheduler.finished(req_id)
+    entry = pending.pop(req_id, None)
+    if entry and not entry.future.done():
+        entry.future.set_result(msg)
+    else:
+        LOG.warning("Respuesta con id=%s no tiene cliente pendiente. ¿Timeout previo?", req_id)
+
+# =======================
+#  Scheduler por pestaña
+#  Cada pestaña del navegador es un worker: como mucho una petición en vuelo por
+#  pestaña (la extensión no sabe emparejar dos respuestas del mismo tab), varias
+#  pestañas en paralelo, y dentro de cada una primero la mayor prioridad (FIFO a igualdad).
+#  La pestaña se libera cuando la extensión responde a esa petición (o pasado
+#  EXTENSION_TIMEOUT), no cuando el cliente deja de esperar: si el cliente se
+#  desconecta o vence REQUEST_TIMEOUT, la extensión sigue trabajando en ella.
+# =======================
+class TabLane:
+    __slots__ = ("key", "heap", "current", "timer")
+
+    def __init__(self, key):
+        self.key = key
+        self.heap = []        # (-prioridad, secuencia, msg, future)
+        self.current = None   # id de la petición en vuelo
+        self.timer = None     # call_later de EXTENSION_TIMEOUT para la petición en vuelo
+
+class TabScheduler:
+    def __init__(self):
+        self.lanes = {}
+        self._seq = itertools.count()
+        self._busy = {}  # id en vuelo -> TabLane
+
+    @staticmethod
+    def lane_key(msg):
+        """Pestaña destino, o None si el método no ocupa una pestaña."""
+        if msg.get("type") != "RUN":
+            return None
+        name = msg.get("name")
+        args = msg.get("args") or []
+        if name == "send":
+            # send(message, tabNumber = 0)
+            try:
+                return int(args[1]) if len(args) > 1 else 0
+            except (TypeError, ValueError):
+                return 0
+        if name == "reload":
+            # reload() siempre recarga TABS[0]
+            return 0
+        return None
+
+    @staticmethod
+    def priority(msg):
+        try:
+            return int(msg.get("priority", 0))
+        except (TypeError, ValueError):
+            return 0
+
+    def submit(self, msg, fut):
+        """Encola msg; fut es el Future que se resolverá con la respuesta de la extensión."""
+        key = self.lane_key(msg)
+        if key is None:
+            post_to_extension(msg)
+            return
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = TabLane(key)
+        heapq.heappush(lane.heap, (-self.priority(msg), next(self._seq), msg, fut))
+        self._pump(lane)
+
+    def in_flight(self, req_id):
+        return req_id in self._busy
+
+    def _pump(self, lane):
+        while lane.current is None and lane.heap:
+            _, _, msg, fut = heapq.heappop(lane.heap)
+            if fut.done():
+                # Timeout o cliente caído mientras esperaba turno: nunca se envió
+                continue
+            req_id = msg["id"]
+            lane.current = req_id
+            lane.timer = asyncio.get_running_loop().call_later(EXTENSION_TIMEOUT, self._expire, req_id)
+            self._busy[req_id] = lane
+            post_to_extension(msg)
+
+    def finished(self, req_id):
+        """La extensión respondió a req_id: su pestaña pasa a la siguiente petición."""
+        lane = self._busy.pop(req_id, None)
+        if lane is None or lane.current != req_id:
             return
+        lane.timer.cancel()
+        lane.current = lane.timer = None
+        self._pump(lane)
+
+    def _expire(self, req_id):
+        LOG.warning("Sin respuesta de la extensión para id=%s en %ss: se libera la pestaña", req_id, EXTENSION_TIMEOUT)
+        self.finished(req_id)
+
+    def stats(self):
+        return {
+            str(key): {
+                "queued": sum(1 for item in lane.heap if not item[3].done()),
+                "in_flight": lane.current is not None,
+            }
+            for key, lane in sorted(self.lanes.items())
+        }
+
+scheduler = TabScheduler()
+
+# Caché de respuestas (opcional, ver bridge_cache.py). None = desactivada.
+response_cache = cache_from_env()
+# clave de caché -> Future con la respuesta de la petición idéntica que ya está en vuelo
+# (se resuelve siempre: con la respuesta, o con None si el líder no terminó)
+inflight_by_key = {}
+
+# Métodos que resuelve el propio host (type="HOST"), sin pasar por la extensión
+def host_stats(msg):
+    lanes = scheduler.stats()
+    return {
+        "pending": len(pending),
+        "queued": sum(v["queued"] for v in lanes.values()),
+        "tabs": lanes,
+        "cache": response_cache.stats() if response_cache else None,
+    }
+
+HOST_METHODS = {
+    "stats": host_stats,
+}
 
+def handle_host_method(msg):
+    fn = HOST_METHODS.get(msg.get("name"))
+    if fn is None:
+        return {"ok": False, "id": msg.get("id"), "error": f"Método de host no encontrado: {msg.get('name')}"}
+    return {"ok": True, "id": msg.get("id"), "res": fn(msg)}
+
+class TcpSession:
+    """
+    Una conexión TCP. Con framing es persistente: el cliente puede mandar muchas
+    peticiones (cada una con su `id`) sin esperar respuestas; estas vuelven por el
+    mismo socket en el orden en que la extensión las resuelve.
+    Sin framing (cliente legacy): una petición, una respuesta en JSON crudo, cierre.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername") or ("?", "?")
+        self.framed = True
+        self.write_lock = asyncio.Lock()
+        self.tasks = set()
+        self.closed = False
+
+    async def send(self, obj):
+        if self.closed:
+            LOG.warning("Respuesta id=%s descartada: conexión %s:%s ya cerrada",
+                        obj.get("id"), self.addr[0], self.addr[1])
+            return
+        if self.framed:
+            data = encode_frame(obj)
+        else:
+            data = json.dumps(obj, ensure_ascii=False).encode('utf-8')
         try:
-            msg = json.loads(buf.decode('utf-8'))
-        except Exception as e:
-            LOG.warning("JSON inválido desde %s:%s :: %s", addr[0], addr[1], e)
-            conn.sendall(json.dumps({"ok": False, "error": f"JSON inválido: {e}"}).encode('utf-8'))
+            async with self.write_lock:
+                self.writer.write(data)
+                await self.writer.drain()
+        except (ConnectionError, OSError) as e:
+            self.closed = True
+            LOG.warning("No se pudo responder id=%s a %s:%s :: %s", obj.get("id"), self.addr[0], self.addr[1], e)
             return
+        LOG.info("Hacia CLI (TCP) => %s", LazyPreview(obj))
 
-        LOG.info("Desde CLI (TCP) <= %s", safe_preview_json(msg))
+    def send_nowait(self, obj):
+        """
+        Escritura síncrona en el transporte (sin drain): conserva el orden exacto de
+        los CHUNK respecto a la respuesta final. Solo para mensajes pequeños.
+        """
+        if self.closed or self.writer.is_closing():
+            return
+        self.writer.write(encode_frame(obj))
 
+    async def read_request(self):
+        """
+        Lee la siguiente petición. Devuelve None si el cliente cerró.
+        La primera lectura detecta si el cliente es legacy (JSON crudo sin prefijo).
+        """
+        header = await read_header_async(self.reader)
+        if not header:
+            return None
+        if is_legacy_header(header):
+            self.framed = False
+            return await recv_legacy_json_async(self.reader, header)
+        if len(header) < HEADER.size:
+            raise FrameError(f"Cabecera incompleta: {len(header)} bytes")
+        (length,) = HEADER.unpack(header)
+        payload = await recv_frame_payload_async(self.reader, length)
+        return json.loads(payload.decode('utf-8'))
+
+    def ensure_request_id(self, msg):
         req_id = msg.get("id")
         if not req_id:
             # id determinístico por cliente/puerto + timestamp corto
-            req_id = f"tcp-{addr[0]}-{addr[1]}-{int(time.time()*1000)}"
+            req_id = f"tcp-{self.addr[0]}-{self.addr[1]}-{int(time.time()*1000)}"
             msg["id"] = req_id
+        return req_id
 
-        # Registrar cola y enviar a extensión
-        q = queue.Queue(maxsize=1)
-        with pending_lock:
-            pending[req_id] = q
+    async def process(self, msg):
+        """Registra el Future, lo encola en el scheduler y espera (sin hilo) la respuesta."""
+        req_id = self.ensure_request_id(msg)
+        if msg.get("type") == "HOST":
+            await self.send(handle_host_method(msg))
+            return
+        if req_id in pending or scheduler.in_flight(req_id):
+            LOG.warning("id duplicado en vuelo: %s", req_id)
+            await self.send({"ok": False, "id": req_id, "error": "id duplicado en vuelo"})
+            return
 
-        write_message(msg)
+        # Streaming solo con framing: un cliente legacy espera un único JSON
+        on_chunk = self.send_nowait if (msg.get("stream") and self.framed) else None
+        key = response_cache.key_for(msg) if response_cache else None
+        if key:
+            hit = None
+            if key in inflight_by_key:
+                # Misma petición ya en vuelo: compartir su respuesta en vez de repetirla
+                shared = await asyncio.shield(inflight_by_key[key])
+                if response_cache.is_cacheable_response(shared):
+                    hit = response_cache.shared(shared, req_id)
+            if hit is None:
+                hit = response_cache.get(key, req_id)
+            if hit is not None:
+                LOG.info("Caché HIT id=%s", req_id)
+                if on_chunk:
+                    # Quien pidió stream espera CHUNKs: el texto completo va como uno solo
+                    text = response_text(hit)
+                    if text:
+                        on_chunk({"id": req_id, "type": "CHUNK", "delta": text})
+                await self.send(hit)
+                return
 
-        # Esperar respuesta de la extensión
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        shared_result = None
+        if key and key not in inflight_by_key:
+            shared_result = inflight_by_key[key] = loop.create_future()
+        pending[req_id] = PendingRequest(req_id, fut, self, on_chunk)
+        res = None
         try:
-            res = q.get(timeout=15 * 60)  # ajusta si necesitas más
-        except queue.Empty:
-            res = {"ok": False, "id": req_id, "error": "Timeout esperando respuesta de la extensión"}
-            LOG.warning("Timeout esperando respuesta para id=%s", req_id)
-
-        # Responder al cliente
-        payload = json.dumps(res, ensure_ascii=False).encode('utf-8')
-        conn.sendall(payload)
-        LOG.info("Hacia CLI (TCP) => %s", safe_preview_json(res))
-    except Exception:
-        LOG.exception("Error en handler TCP para %s:%s", addr[0], addr[1])
-        try:
-            conn.sendall(json.dumps({"ok": False, "id": req_id, "error": "Excepción en host; ver logs"}).encode('utf-8'))
-        except Exception:
-            pass
-    finally:
-        with pending_lock:
-            if req_id:
+            scheduler.submit(msg, fut)
+            try:
+                res = await asyncio.wait_for(fut, timeout=REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                res = {"ok": False, "id": req_id, "error": "Timeout esperando respuesta de la extensión"}
+                LOG.warning("Timeout esperando respuesta para id=%s", req_id)
+        finally:
+            entry = pending.get(req_id)
+            if entry is not None and entry.future is fut:
                 pending.pop(req_id, None)
+            if shared_result is not None:
+                inflight_by_key.pop(key, None)
+                shared_result.set_result(res)
+        if key and response_cache.is_cacheable_response(res):
+            response_cache.put(key, res)
+        await self.send(res)
+
+    def spawn(self, msg):
+        task = asyncio.create_task(self.process(msg))
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            LOG.error("Error procesando petición en %s:%s", self.addr[0], self.addr[1], exc_info=task.exception())
+
+    async def run(self):
+        LOG.info("Conexión TCP aceptada desde %s:%s", self.addr[0], self.addr[1])
+        aborted = False
         try:
-            conn.close()
+            while True:
+                try:
+                    msg = await self.read_request()
+                except FrameError as e:
+                    LOG.warning("Frame inválido desde %s:%s :: %s", self.addr[0], self.addr[1], e)
+                    await self.send({"ok": False, "error": f"Frame inválido: {e}"})
+                    return
+                except ValueError as e:
+                    LOG.warning("JSON inválido desde %s:%s :: %s", self.addr[0], self.addr[1], e)
+                    await self.send({"ok": False, "error": f"JSON inválido: {e}"})
+                    if not self.framed:
+                        return
+                    # El frame se consumió completo: la conexión sigue siendo utilizable
+                    continue
+
+                if msg is None:
+                    return
+
+                LOG.info("Desde CLI (TCP) <= %s", LazyPreview(msg))
+                if not self.framed:
+                    LOG.info("Cliente legacy (sin framing) desde %s:%s", self.addr[0], self.addr[1])
+                    await self.process(msg)
+                    return
+                self.spawn(msg)
+        except (ConnectionError, OSError) as e:
+            aborted = True
+            LOG.warning("Conexión %s:%s interrumpida :: %s", self.addr[0], self.addr[1], e)
+        except asyncio.CancelledError:
+            # Cierre del host: nadie va a responder a lo que quede en vuelo
+            aborted = True
+            raise
         except Exception:
-            pass
-        LOG.info("Conexión TCP cerrada %s:%s", addr[0], addr[1])
+            aborted = True
+            LOG.exception("Error en handler TCP para %s:%s", self.addr[0], self.addr[1])
+            try:
+                await self.send({"ok": False, "error": "Excepción en host; ver logs"})
+            except Exception:
+                pass
+        finally:
+            # Con framing, las respuestas en vuelo aún pueden llegar mientras el
+            # cliente solo cerró su lado de escritura: esperarlas antes de cerrar.
+            # Si la conexión se rompió, no hay a quién responder.
+            if aborted:
+                for task in self.tasks:
+                    task.cancel()
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+            self.closed = True
+            try:
+                self.writer.close()
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+            LOG.info("Conexión TCP cerrada %s:%s", self.addr[0], self.addr[1])
 
-def tcp_server():
-    LOG.info("Iniciando servidor TCP… HOST=%s PORT=%s", HOST, PORT)
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen(8)
-        LOG.info("Servidor TCP LISTENING en %s:%s (pid=%s)", HOST, PORT, os.getpid())
-        while True:
-            conn, addr = s.accept()
-            t = threading.Thread(target=tcp_client_handler, args=(conn, addr), daemon=True)
-            t.start()
-    except Exception:
-        LOG.exception("Error en servidor TCP principal.")
-    finally:
+# Tareas de las conexiones abiertas: se cancelan y esperan al cerrar el host
+live_sessions = set()
+
+async def tcp_client_handler(reader, writer):
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
         try:
-            s.close()
-        except Exception:
+            # Frames pequeños en conexiones persistentes: sin Nagle
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
             pass
-        LOG.info("Servidor TCP detenido.")
+    task = asyncio.current_task()
+    live_sessions.add(task)
+    try:
+        await TcpSession(reader, writer).run()
+    finally:
+        live_sessions.discard(task)
+
+async def stop_sessions():
+    """Cancela las conexiones abiertas y espera a que cierren (sin trazas en stderr)."""
+    tasks = [t for t in live_sessions if not t.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def start_tcp_server():
+    LOG.info("Iniciando servidor TCP… HOST=%s PORT=%s", HOST, PORT)
+    server = await asyncio.start_server(tcp_client_handler, HOST, PORT, reuse_address=True, backlog=256)
+    LOG.info("Servidor TCP LISTENING en %s:%s (pid=%s)", HOST, PORT, os.getpid())
+    return server
 
-def from_extension_loop():
+async def from_extension_loop():
+    """
+    Lee STDIN dentro del loop. En POSIX el pipe se conecta al loop directamente;
+    en Windows (ProactorEventLoop no soporta el pipe anónimo de STDIN) un único hilo
+    hace la lectura bloqueante y entrega cada mensaje al loop.
+    """
     LOG.info("Esperando mensajes desde EXTENSIÓN (loop STDIO)…")
-    while True:
-        msg = read_message()
-        if msg is None:
-            LOG.warning("Extensión desconectada o STDIN cerrado. Saliendo loop STDIO.")
-            break
+    loop = asyncio.get_running_loop()
 
-        req_id = msg.get("id")
-        if not req_id:
-            LOG.warning("Mensaje desde EXTENSIÓN sin 'id': %s", safe_preview_json(msg))
-            continue
+    if os.name != "nt":
+        reader = asyncio.StreamReader(limit=2 ** 31 - 1)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+        while True:
+            msg = await read_message_async(reader)
+            if msg is None:
+                break
+            deliver_from_extension(msg)
+    else:
+        done = loop.create_future()
 
-        # Entregar al cliente que espera esa respuesta
-        with pending_lock:
-            q = pending.get(req_id)
+        def stdin_thread():
+            while True:
+                msg = read_message()
+                if msg is None:
+                    break
+                loop.call_soon_threadsafe(deliver_from_extension, msg)
+            loop.call_soon_threadsafe(done.set_result, None)
 
-        if q:
-            try:
-                q.put(msg, timeout=0.1)
-            except Exception:
-                LOG.exception("No se pudo colocar respuesta en cola para id=%s", req_id)
-        else:
-            LOG.warning("Respuesta con id=%s no tiene cliente pendiente. ¿Timeout previo?", req_id)
+        threading.Thread(target=stdin_thread, name="STDIN", daemon=True).start()
+        await done
+
+    LOG.warning("Extensión desconectada o STDIN cerrado. Saliendo loop STDIO.")
 
 def install_excepthook():
     def handle(exc_type, exc_value, exc_traceback):
@@ -201,18 +635,44 @@ def install_excepthook():
         LOG.error("Excepción no capturada: %s", "".join(traceback.format_exception(exc_type, exc_value, exc_traceback)))
     sys.excepthook = handle
 
+def handle_loop_exception(loop, context):
+    # En vez del handler por defecto de asyncio, que escribe en stderr
+    exc = context.get("exception")
+    if isinstance(exc, asyncio.CancelledError):
+        LOG.debug("Tarea cancelada al cerrar: %s", context.get("message"))
+        return
+    LOG.error("Excepción en el event loop: %s", context.get("message"), exc_info=exc)
+
+async def main_async():
+    asyncio.get_running_loop().set_exception_handler(handle_loop_exception)
+    try:
+        server = await start_tcp_server()
+    except Exception:
+        LOG.exception("Error en servidor TCP principal.")
+        server = None
+
+    try:
+        # Bucle principal leyendo desde la extensión
+        await from_extension_loop()
+    finally:
+        if server is not None:
+            server.close()
+            await stop_sessions()
+            LOG.info("Servidor TCP detenido.")
+
 def main():
     install_excepthook()
     log_env_info()
 
-    # Arranca el servidor TCP en un hilo
-    tcp_thread = threading.Thread(target=tcp_server, name="TCP-Server", daemon=True)
-    tcp_thread.start()
-
-    # Bucle principal leyendo desde la extensión
-    from_extension_loop()
+    try:
+        asyncio.run(main_async())
+    except KeyboardInterrupt:
+        LOG.info("KeyboardInterrupt recibido. Cerrando.")
+    except Exception:
+        LOG.exception("Error en el event loop principal.")
 
     LOG.info("Terminando Native Host.")
+    stop_logging()
     # Importante: salir sin imprimir nada
     os._exit(0)
 
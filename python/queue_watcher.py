@@ -1,9 +1,25 @@
 import asyncio
-import time
+import ctypes
+import errno
+import functools
+import hashlib
+import json
+import os
+import random
 import re
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import httpx
 
+try:
+    from watcher_journal import JobJournal
+    from watcher_dedup import DedupIndex
+except ImportError:  # python sin sqlite3 (imagen recortada): se trabaja solo con renames
+    JobJournal = None
+    DedupIndex = None
+
 # -----------------------------
 # CONFIG
 # -----------------------------
@@ -11,8 +27,11 @@ QUEUE_DIR = Path("/data/gamegen/context/queque")
 BASE_DIR  = Path("/data/gamegen/context")
 
 PROMPT_DIR  = Path("/prompt")
-HUMAN_PROMPT_FILE = PROMPT_DIR / "human_prompt.txt"
-MACHINE_PROMPT_FILE = PROMPT_DIR / "machine_prompt.txt"
+# Plantillas por nombre (archivo <nombre>.txt en PROMPT_DIR)
+HUMAN_PROMPT = os.getenv("WATCHER_HUMAN_PROMPT", "human_prompt")
+MACHINE_PROMPT = os.getenv("WATCHER_MACHINE_PROMPT", "machine_prompt")
+# Sin inotify: cada cuánto como máximo se hace stat() de una plantilla cacheada
+PROMPT_CHECK_SECONDS = float(os.getenv("WATCHER_PROMPT_CHECK_SECONDS", "5"))
 
 OUT_LOG_DIR     = BASE_DIR / "log"
 OUT_MESSAGE_DIR = BASE_DIR / "message"
@@ -21,21 +40,133 @@ OLLAMA_URL = "http://host.docker.internal:11434/api/generate"
 MODEL_HUMAN = "llama3.1:8b"
 MODEL_MACHINE = "qwen2.5:14b"
 
-POLL_SECONDS = 2.0  # cada cuánto revisa nuevos archivos
+POLL_SECONDS = 2.0  # cada cuánto revisa nuevos archivos (modo poll)
+
+# Archivos procesándose a la vez
+WORKERS = int(os.getenv("WATCHER_WORKERS", "4"))
+# Llamadas simultáneas a Ollama por modelo (lo que aguante el servidor/GPU)
+MODEL_CONCURRENCY = {
+    MODEL_HUMAN: int(os.getenv("WATCHER_HUMAN_CONCURRENCY", "2")),
+    MODEL_MACHINE: int(os.getenv("WATCHER_MACHINE_CONCURRENCY", "2")),
+}
+# Backpressure: archivos reclamables en espera antes de dejar de encolar
+JOB_QUEUE_SIZE = int(os.getenv("WATCHER_QUEUE_SIZE", str(WORKERS * 2)))
+
+# Timeout de lectura por modelo (segundos); la conexión falla rápido aparte
+OLLAMA_TIMEOUTS = {
+    MODEL_HUMAN: float(os.getenv("WATCHER_HUMAN_TIMEOUT", "600")),
+    MODEL_MACHINE: float(os.getenv("WATCHER_MACHINE_TIMEOUT", "600")),
+}
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("WATCHER_CONNECT_TIMEOUT", "10"))
+# Reintentos ante errores transitorios (conexión, 408/429/5xx), con backoff exponencial
+# + jitter. Un ReadTimeout no se reintenta: el modelo ya tardó el timeout entero y
+# repetirlo solo retiene al worker. Tope de tiempo total por archivo (0 = sin tope).
+OLLAMA_RETRIES = int(os.getenv("WATCHER_OLLAMA_RETRIES", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("WATCHER_RETRY_BASE_SECONDS", "1"))
+RETRY_MAX_SECONDS = 30.0
+RETRY_BUDGET_SECONDS = float(os.getenv("WATCHER_RETRY_BUDGET_SECONDS", "120"))
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Streaming: consume el NDJSON de Ollama y escribe la salida a medida que llega
+STREAM_MODE = os.getenv("WATCHER_STREAM", "0").lower() in ("1", "true", "yes", "on")
+
+# Batching (opcional): junta archivos pequeños que llegan juntos en una sola generación
+BATCH_MODE = os.getenv("WATCHER_BATCH", "0").lower() in ("1", "true", "yes", "on")
+BATCH_WINDOW_SECONDS = float(os.getenv("WATCHER_BATCH_WINDOW_SECONDS", "1.5"))
+BATCH_MAX_FILES = int(os.getenv("WATCHER_BATCH_MAX_FILES", "8"))
+BATCH_MAX_BYTES = int(os.getenv("WATCHER_BATCH_MAX_BYTES", str(32 * 1024)))
+# Solo se agrupan archivos por debajo de este tamaño; el resto va solo
+BATCH_FILE_MAX_BYTES = int(os.getenv("WATCHER_BATCH_FILE_MAX_BYTES", str(4 * 1024)))
+
+# Journal de trabajos (SQLite WAL) compartible entre varios watchers (opcional).
+# Vacío = desactivado: claim por rename, como siempre. Ej: WATCHER_JOURNAL_DB=/data/queue_journal.db
+JOURNAL_DB = os.getenv("WATCHER_JOURNAL_DB", "")
+# Lease de cada claim; se renueva mientras se procesa. Si el dueño muere, otro la recupera.
+LEASE_SECONDS = float(os.getenv("WATCHER_LEASE_SECONDS", "60"))
+
+# Dedup (opcional): reutiliza salidas de entradas idénticas ya procesadas. Vacío =
+# desactivado: volver a encolar una entrada la regenera (así se reintenta una mala salida).
+DEDUP_DB = os.getenv("WATCHER_DEDUP_DB", "")
+DEDUP_MAX_BYTES = int(os.getenv("WATCHER_DEDUP_MAX_BYTES", str(64 * 1024 * 1024)))
+DEDUP_TTL_SECONDS = float(os.getenv("WATCHER_DEDUP_TTL_SECONDS", str(7 * 86400)))
+
+# auto: inotify en Linux si está disponible, si no polling | inotify | poll
+WATCH_MODE = os.getenv("WATCHER_MODE", "auto")
+# En modo inotify igual se re-escanea cada tanto: por si se pierden eventos
+# (overflow de la cola del kernel, bind mounts de Docker Desktop que no los propagan).
+RESCAN_SECONDS = float(os.getenv("WATCHER_RESCAN_SECONDS", "60"))
 
 # -----------------------------
 # RESERVED WORDS STRIPPER
 # -----------------------------
-# 1) Convierte flow_XXX -> XXX
-FLOW_UNDERSCORE_RE = re.compile(r"\bflow_([A-Za-z0-9_]+)\b", re.IGNORECASE)
+# Reglas de palabras reservadas, en orden: cada regla ve el resultado de las
+# anteriores (igual que las pasadas encadenadas de antes: flow_flowX -> flowX -> "").
+# (patrón de UNA sola palabra sin \b ni grupos con nombre, reemplazo estilo re.sub).
+# Se aplican sin distinguir mayúsculas/minúsculas.
+RESERVED_RULES = [
+    (r"EOF", "E-O-F"),                 # EOF -> E-O-F (referencial)
+    (r"flow_([A-Za-z0-9_]+)", r"\1"),  # flow_XXX -> XXX
+    (r"flow[A-Za-z0-9_]*", ""),        # flowStep / FLOWABC -> (elimina)
+]
 
-# 2) Elimina cualquier token tipo flowStep / FLOWABC (sin underscore)
-FLOW_TOKEN_RE = re.compile(r"\bflow[A-Za-z0-9_]*\b", re.IGNORECASE)
+class SanitizerEngine:
+    """
+    Compila todas las reglas en UNA regex combinada (una sola pasada para todas las
+    palabras reservadas) y deja el resto en pasadas con plantilla fija, sin callback:
+    paréntesis vacíos, colapso de espacios/tabs y espacios antes de puntuación.
+    """
+    EMPTY_PARENS_RE = re.compile(r"\(\s*\)")
+    SPACES_RE = re.compile(r"[ \t]{2,}")
+    PUNCT_SPACE_RE = re.compile(r"\s+(?=[,.;:!?])")
 
-EMPTY_PARENS_RE = re.compile(r"\(\s*\)")  # elimina paréntesis vacíos resultantes
+    def __init__(self, rules):
+        self.rules = [re.compile(rf"\b(?:{pat})\b", re.IGNORECASE) for pat, _ in rules]
+        self.repls = [repl for _, repl in rules]
+        words = "|".join(rf"(?P<r{i}>{pat})\b" for i, (pat, _) in enumerate(rules))
+        self.word_re = re.compile(rf"\b(?:{words})", re.IGNORECASE)
+        # m.lastindex -> índice de la regla que hizo match
+        self.groups = {self.word_re.groupindex[f"r{i}"]: i for i in range(len(rules))}
+        # Reemplazos fijos (sin \1): ya encadenados con las reglas siguientes
+        self.static = {i: self._chain(i, r) for i, r in enumerate(self.repls) if "\\" not in r}
+        self._dynamic = {}
 
-# EOF -> E-O-F (referencial)
-EOF_RE = re.compile(r"\bEOF\b", re.IGNORECASE)
+    def _chain(self, i: int, text: str) -> str:
+        for j in range(i + 1, len(self.rules)):
+            if not text:
+                break
+            text = self.rules[j].sub(self.repls[j], text)
+        return text
+
+    def _word(self, m) -> str:
+        i = self.groups[m.lastindex]
+        out = self.static.get(i)
+        if out is not None:
+            return out
+        word = m.group()
+        out = self._dynamic.get((i, word))
+        if out is None:
+            out = self._chain(i, self.rules[i].fullmatch(word).expand(self.repls[i]))
+            if len(self._dynamic) < 4096:
+                self._dynamic[(i, word)] = out
+        return out
+
+    def clean(self, text: str) -> str:
+        """Todo menos el strip() final."""
+        if not text:
+            return text
+        text = self.word_re.sub(self._word, text)
+        if "(" in text:
+            text = self.EMPTY_PARENS_RE.sub("", text)
+        if "  " in text or "\t" in text:
+            text = self.SPACES_RE.sub(" ", text)
+        return self.PUNCT_SPACE_RE.sub("", text)
+
+    def touches(self, text: str, pos: int) -> bool:
+        """True si alguna regla reescribe la palabra que empieza en `pos`."""
+        return self.word_re.match(text, pos) is not None
+
+RESERVED = SanitizerEngine(RESERVED_RULES)
 
 def strip_reserved(text: str) -> str:
     """
@@ -46,26 +177,66 @@ def strip_reserved(text: str) -> str:
     """
     if not text:
         return text
+    return RESERVED.clean(text).strip()
 
-    # EOF -> E-O-F
-    text = EOF_RE.sub("E-O-F", text)
+def _strip_reserved_body(text: str) -> str:
+    # strip_reserved sin el strip() final (lo usa también StreamSanitizer)
+    return RESERVED.clean(text)
 
-    # flow_XXX -> XXX
-    text = FLOW_UNDERSCORE_RE.sub(r"\1", text)
+# Corte seguro para limpiar por partes: palabra completa precedida de espacio
+# que ninguna regla reescribe
+STREAM_CUT_RE = re.compile(r"(?<=\s)\w+(?=\W)")
 
-    # elimina cualquier flowToken restante
-    text = FLOW_TOKEN_RE.sub("", text)
+class StreamSanitizer:
+    """
+    strip_reserved incremental para texto que llega por trozos.
 
-    # limpia paréntesis vacíos
-    text = EMPTY_PARENS_RE.sub("", text)
+    Solo se limpia hasta un corte seguro: justo antes de una palabra completa,
+    precedida de espacio, que ninguna regla toca. Ninguna regla puede cruzar ese
+    punto (a la izquierda queda espacio, a la derecha una palabra que no cambia), así
+    que limpiar por partes da exactamente lo mismo que limpiar el texto entero.
+    El strip() final se emula: se descarta el espacio inicial y el espacio final se
+    retiene hasta saber si detrás viene más texto.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._scan = 0  # desde aquí pueden aparecer palabras nuevas
+        self._started = False
+        self._held = ""
 
-    # colapsa espacios múltiples
-    text = re.sub(r"[ \t]{2,}", " ", text)
+    def feed(self, text: str) -> str:
+        self._buf += text
+        cut = 0
+        for m in STREAM_CUT_RE.finditer(self._buf, self._scan):
+            self._scan = m.end()
+            if not RESERVED.touches(self._buf, m.start()):
+                cut = m.start()
+        if not cut:
+            return ""
+        head, self._buf = self._buf[:cut], self._buf[cut:]
+        self._scan -= cut
+        return self._emit(_strip_reserved_body(head))
 
-    # limpia espacios antes de puntuación simple
-    text = re.sub(r"\s+([,.;:!?])", r"\1", text)
+    def close(self) -> str:
+        tail, self._buf, self._scan = self._buf, "", 0
+        out = self._emit(_strip_reserved_body(tail))
+        self._held = ""
+        return out
 
-    return text.strip()
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        body = text.rstrip()
+        if not body:
+            self._held += text
+            return ""
+        out = self._held + body
+        self._held = text[len(body):]
+        return out
 
 # -----------------------------
 # HELPERS
@@ -81,20 +252,283 @@ def read_text(path: Path) -> str:
 
 def write_text(path: Path, content: str):
     # SIEMPRE texto plano. Nunca formateo JSON, nunca pretty, nunca validación.
-    path.write_text(content if content is not None else "", encoding="utf-8", errors="replace")
+    # Temporal + os.replace: quien lee nunca ve un archivo a medias y reescribir es idempotente.
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(content if content is not None else "", encoding="utf-8", errors="replace")
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
 
-def load_prompts() -> tuple[str, str]:
-    human_tpl = read_text(HUMAN_PROMPT_FILE)
-    machine_tpl = read_text(MACHINE_PROMPT_FILE)
-    return human_tpl, machine_tpl
+def load_prompts(store) -> tuple:
+    return store.get(HUMAN_PROMPT), store.get(MACHINE_PROMPT)
 
-def render_prompt(template: str, raw_logs: str) -> str:
-    return template.replace("{{RAW_LOG_TEXT}}", raw_logs)
+def render_prompt(template, raw_logs: str, **values) -> str:
+    values["RAW_LOG_TEXT"] = raw_logs
+    return template.render(values)
 
 def list_txt_files():
     # Solo .txt (ignora .processing)
     return sorted([p for p in QUEUE_DIR.glob("*.txt") if p.is_file()])
 
+# -----------------------------
+# EVENTOS DE LA COLA (inotify vía ctypes, fallback a polling)
+# -----------------------------
+class InotifyWatcher:
+    """
+    inotify mínimo sobre libc con ctypes (sin dependencias).
+    Solo interesa cuando un archivo queda completo en el directorio:
+    IN_CLOSE_WRITE (se terminó de escribir) e IN_MOVED_TO (rename atómico hacia aquí).
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_Q_OVERFLOW = 0x00004000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (+ name[len])
+
+    IN_MOVED_FROM = 0x00000040
+    IN_DELETE = 0x00000200
+
+    def __init__(self, directory: Path, mask: int = None):
+        if mask is None:
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO
+        libc = ctypes.CDLL(None, use_errno=True)  # glibc y musl (alpine) exponen inotify_*
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify no disponible")
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch falló para {directory}")
+
+    def read_events(self):
+        """Lee todo lo disponible sin bloquear. Devuelve (nombres, overflow)."""
+        names, overflow = [], False
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos + self.EVENT.size <= len(buf):
+                _, mask, _, length = self.EVENT.unpack_from(buf, pos)
+                pos += self.EVENT.size
+                name = buf[pos:pos + length].rstrip(b"\0")
+                pos += length
+                if mask & self.IN_Q_OVERFLOW:
+                    overflow = True
+                elif name:
+                    names.append(os.fsdecode(name))
+        return names, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class QueueSource:
+    """
+    Entrega lotes de archivos a procesar.
+    - inotify: reacciona a eventos (milisegundos) y solo re-escanea el directorio al
+      arrancar, tras un overflow o cada RESCAN_SECONDS.
+    - poll: escanea cada POLL_SECONDS (comportamiento original, pero sin bloquear el loop).
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.watcher = None
+        self.events = None
+        self.needs_scan = True
+        if WATCH_MODE != "poll":
+            try:
+                self.watcher = InotifyWatcher(directory)
+            except (OSError, AttributeError) as e:
+                if WATCH_MODE == "inotify":
+                    raise
+                print(f"[Watcher] inotify no disponible ({e}); usando polling")
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self.watcher else "poll"
+
+    def start(self):
+        if self.watcher:
+            self.events = asyncio.Queue()
+            asyncio.get_running_loop().add_reader(self.watcher.fd, self._on_readable)
+
+    def _on_readable(self):
+        names, overflow = self.watcher.read_events()
+        if overflow:
+            self.needs_scan = True
+        for name in names:
+            self.events.put_nowait(name)
+        if overflow and not names:
+            self.events.put_nowait(None)  # despierta al consumidor para el rescan
+
+    def request_rescan(self):
+        self.needs_scan = True
+
+    async def next_batch(self) -> list:
+        if not self.watcher:
+            if not self.needs_scan:
+                await asyncio.sleep(POLL_SECONDS)
+            self.needs_scan = False
+            return list_txt_files()
+
+        if not self.needs_scan:
+            try:
+                first = await asyncio.wait_for(self.events.get(), timeout=RESCAN_SECONDS)
+            except asyncio.TimeoutError:
+                self.needs_scan = True
+            else:
+                names = [first]
+                while not self.events.empty():
+                    names.append(self.events.get_nowait())
+                if not self.needs_scan:
+                    paths = {QUEUE_DIR / n for n in names if n and n.endswith(".txt")}
+                    return sorted(p for p in paths if p.is_file())
+
+        self.needs_scan = False
+        while not self.events.empty():
+            self.events.get_nowait()  # el escaneo completo ya los cubre
+        return list_txt_files()
+
+    def close(self):
+        if self.watcher:
+            asyncio.get_running_loop().remove_reader(self.watcher.fd)
+            self.watcher.close()
+
+# -----------------------------
+# PLANTILLAS (PROMPTS)
+# -----------------------------
+PLACEHOLDER_RE = re.compile(r"\{\{([A-Za-z_][A-Za-z0-9_]*)\}\}")
+# Valores que pone el watcher en cada render (no son otras plantillas)
+RUNTIME_PLACEHOLDERS = {"RAW_LOG_TEXT", "FILE_NAME", "MODEL"}
+
+class PromptTemplate:
+    """
+    Plantilla precompilada: el texto se parte una sola vez en literales y nombres de
+    placeholder ({{NOMBRE}}); render() solo une segmentos.
+    """
+
+    def __init__(self, text: str, resolve=None):
+        parts = PLACEHOLDER_RE.split(text)
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+        self.resolve = resolve
+        self.digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def fingerprint(self) -> str:
+        """Huella del texto + el texto actual de las plantillas incluidas con {{nombre}}."""
+        includes = sorted(set(self.names) - RUNTIME_PLACEHOLDERS)
+        if not includes or self.resolve is None:
+            return self.digest
+        h = hashlib.sha256(self.digest.encode("ascii"))
+        for name in includes:
+            h.update(f"\0{name}\0{self.resolve(name) or ''}".encode("utf-8"))
+        return h.hexdigest()
+
+    def render(self, values: dict) -> str:
+        """
+        `values` tiene prioridad; si no, `resolve(nombre)` (otra plantilla de
+        PROMPT_DIR). Un placeholder sin valor se deja tal cual, como hacía str.replace.
+        """
+        out = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            value = values.get(name)
+            if value is None and self.resolve is not None:
+                value = self.resolve(name)
+            out.append(value if value is not None else "{{" + name + "}}")
+            out.append(literal)
+        return "".join(out)
+
+
+class PromptStore:
+    """
+    Caché de plantillas de PROMPT_DIR por nombre: "human_prompt", "initial",
+    "continue", "outProtocole"...
+
+    Un archivo solo se vuelve a leer si cambió (inode, mtime_ns, tamaño). Con inotify
+    los cambios llegan como eventos y en régimen estable no hay ni stat(); sin inotify
+    (o con WATCHER_MODE=poll) se hace stat() como mucho cada PROMPT_CHECK_SECONDS por
+    plantilla. Los nombres sin archivo también se recuerdan (firma None), así que un
+    {{nombre}} sin .txt no cuesta un stat() en cada render.
+    Dentro de una plantilla, {{otra}} se sustituye por el texto de otra.txt.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._entries = {}  # nombre -> [firma o None si no existe, revisado_en, PromptTemplate, texto]
+        self.watcher = None
+        if WATCH_MODE != "poll":
+            try:
+                self.watcher = InotifyWatcher(directory, InotifyWatcher.IN_CLOSE_WRITE | InotifyWatcher.IN_MOVED_TO
+                                              | InotifyWatcher.IN_MOVED_FROM | InotifyWatcher.IN_DELETE)
+            except (OSError, AttributeError):
+                pass
+
+    @property
+    def check_seconds(self) -> float:
+        # con eventos el stat periódico es solo una red de seguridad (bind mounts sin eventos)
+        return RESCAN_SECONDS if self.watcher else PROMPT_CHECK_SECONDS
+
+    def start(self):
+        if self.watcher:
+            asyncio.get_running_loop().add_reader(self.watcher.fd, self._on_readable)
+
+    def _on_readable(self):
+        names, overflow = self.watcher.read_events()
+        if overflow:
+            self._entries.clear()
+            return
+        for name in names:
+            if name.endswith(".txt"):
+                self._entries.pop(name[:-4], None)
+
+    def path_for(self, name: str) -> Path:
+        return self.directory / f"{name}.txt"
+
+    def _load(self, name: str):
+        now = time.monotonic()
+        entry = self._entries.get(name)
+        if entry is not None and now - entry[1] < self.check_seconds:
+            return entry
+        path = self.path_for(name)
+        try:
+            st = path.stat()
+        except (FileNotFoundError, NotADirectoryError):
+            st = None
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size) if st is not None else None
+        if entry is not None and entry[0] == stamp:
+            entry[1] = now
+            return entry
+        if stamp is None:
+            entry = self._entries[name] = [None, now, None, None]
+            return entry
+        text = read_text(path)
+        entry = self._entries[name] = [stamp, now, PromptTemplate(text, self.text), text]
+        return entry
+
+    def get(self, name: str) -> PromptTemplate:
+        entry = self._load(name)
+        if entry[0] is None:
+            path = self.path_for(name)
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(path))
+        return entry[2]
+
+    def text(self, name: str):
+        """Texto crudo de <nombre>.txt, o None si no existe (para {{nombre}} dentro de otra)."""
+        return self._load(name)[3]
+
+    def close(self):
+        if self.watcher:
+            asyncio.get_running_loop().remove_reader(self.watcher.fd)
+            self.watcher.close()
+
 # -----------------------------
 # OLLAMA (MÁS SEGURO ANTI-FALLOS)
 # -----------------------------
@@ -109,7 +543,65 @@ def extract_response_field(obj) -> str:
             return resp
     return ""
 
-async def ollama_generate(client: httpx.AsyncClient, model: str, prompt: str) -> str:
+_model_slots = {}
+
+def model_slot(model: str) -> asyncio.Semaphore:
+    """Semáforo por modelo (MODEL_CONCURRENCY; 1 para modelos no configurados)."""
+    slot = _model_slots.get(model)
+    if slot is None:
+        slot = _model_slots[model] = asyncio.Semaphore(max(1, MODEL_CONCURRENCY.get(model, 1)))
+    return slot
+
+def make_http_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP compartido por todo el watcher: conserva el pool de conexiones y el
+    keep-alive con Ollama entre archivos. El pool cubre todos los slots de modelo.
+    """
+    slots = sum(max(1, n) for n in MODEL_CONCURRENCY.values())
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=slots, max_keepalive_connections=slots, keepalive_expiry=120),
+        timeout=httpx.Timeout(600, connect=OLLAMA_CONNECT_TIMEOUT),
+    )
+
+def ollama_timeout(model: str) -> httpx.Timeout:
+    read = OLLAMA_TIMEOUTS.get(model, 600)
+    return httpx.Timeout(read, connect=OLLAMA_CONNECT_TIMEOUT)
+
+def is_transient(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRY_STATUS
+    return isinstance(exc, RETRY_ERRORS)
+
+def retry_delay(attempt: int) -> float:
+    # "full jitter": evita que varios workers reintenten todos a la vez
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** attempt)))
+
+async def ollama_generate(client: httpx.AsyncClient, model: str, prompt: str, out_paths=None) -> str:
+    """
+    Genera con reintentos. Con `out_paths` (modo streaming) la salida ya limpia se va
+    escribiendo en esos archivos y no se devuelve nada; cada reintento los reescribe.
+    """
+    attempt = 0
+    started = time.monotonic()
+    while True:
+        try:
+            async with model_slot(model):
+                if out_paths is not None:
+                    return await _ollama_generate_stream(client, model, prompt, out_paths)
+                return await _ollama_generate(client, model, prompt)
+        except Exception as e:
+            if attempt >= OLLAMA_RETRIES or not is_transient(e):
+                raise
+            delay = retry_delay(attempt)
+            if RETRY_BUDGET_SECONDS and time.monotonic() - started + delay > RETRY_BUDGET_SECONDS:
+                raise
+            attempt += 1
+            reason = (str(e).splitlines() or [""])[0]
+            print(f"[WARN] Ollama {model}: {type(e).__name__} {reason} -> reintento {attempt}/{OLLAMA_RETRIES} en {delay:.1f}s")
+            # el backoff ocurre fuera del semáforo: no bloquea el slot del modelo
+            await asyncio.sleep(delay)
+
+async def _ollama_generate(client: httpx.AsyncClient, model: str, prompt: str) -> str:
     """
     Estrategia anti-fallos:
     1) Hace POST usando json=payload (request correcto y estándar).
@@ -124,7 +616,7 @@ async def ollama_generate(client: httpx.AsyncClient, model: str, prompt: str) ->
         "options": {"temperature": 0.2}
     }
 
-    r = await client.post(OLLAMA_URL, json=payload, timeout=600)
+    r = await client.post(OLLAMA_URL, json=payload, timeout=ollama_timeout(model))
     r.raise_for_status()
 
     # Intento 1: JSON real
@@ -139,39 +631,183 @@ async def ollama_generate(client: httpx.AsyncClient, model: str, prompt: str) ->
         # Intento 2: texto crudo, sin parseo
         return (r.text or "").strip()
 
+async def _ollama_generate_stream(client: httpx.AsyncClient, model: str, prompt: str, out_paths) -> None:
+    """
+    Consume el NDJSON de Ollama línea a línea; la memoria no crece con la respuesta.
+    Misma filosofía anti-fallos: una línea que no es JSON o no trae "response"
+    (p.ej. {"error": ...}) se escribe tal cual en vez de romper.
+    Se escribe en <salida>.partial y solo al terminar se hace os.replace() sobre la
+    salida (como write_text): nadie ve una salida a medias y un fallo no la trunca.
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "options": {"temperature": 0.2}
+    }
+    sanitizer = StreamSanitizer()
+    partials = [p.with_name(p.name + ".partial") for p in out_paths]
+    files = []
+    ok = False
+    try:
+        for tmp in partials:
+            files.append(open(tmp, "w", encoding="utf-8", errors="replace"))
+        async with client.stream("POST", OLLAMA_URL, json=payload, timeout=ollama_timeout(model)) as r:
+            if r.is_error:
+                await r.aread()
+                r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.strip():
+                    continue
+                done = False
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    piece = line + "\n"
+                else:
+                    if isinstance(obj, dict) and isinstance(obj.get("response"), str):
+                        piece = obj["response"]
+                        done = obj.get("done") is True
+                    else:
+                        piece = line + "\n"
+                _write_piece(files, sanitizer.feed(piece))
+                if done:
+                    break
+        _write_piece(files, sanitizer.close())
+        ok = True
+    finally:
+        for f in files:
+            f.close()
+        if ok:
+            for tmp, path in zip(partials, out_paths):
+                os.replace(tmp, path)
+        else:
+            for tmp in partials:
+                tmp.unlink(missing_ok=True)
+
+def _write_piece(files, text: str):
+    if not text:
+        return
+    for f in files:
+        f.write(text)
+        f.flush()  # el .partial muestra el progreso a quien lo siga (tail -f)
+
+# -----------------------------
+# SQLITE FUERA DEL EVENT LOOP
+# -----------------------------
+class DbWorker:
+    """
+    Un objeto SQLite (journal, dedup) confinado en su propio hilo: la conexión se abre
+    ahí y todas sus llamadas se ejecutan ahí. Con `await db.run(...)` las esperas de
+    lock (busy timeout de hasta 30s) y la E/S no bloquean a los workers ni a inotify.
+    Atributos simples (owner, lease, contadores) se leen directamente de `db.obj`.
+    """
+
+    def __init__(self, factory, name: str):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        try:
+            self.obj = self._pool.submit(factory).result()
+        except BaseException:
+            self._pool.shutdown()
+            raise
+
+    async def run(self, method: str, *args, **kwargs):
+        call = functools.partial(getattr(self.obj, method), *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+
+    def close(self):
+        self._pool.submit(self.obj.close).result()
+        self._pool.shutdown()
+
 # -----------------------------
 # PROCESSING
 # -----------------------------
-async def process_file(file_path: Path, human_tpl: str, machine_tpl: str):
-    # Claim atómico para que no se procese doble
-    processing_path = file_path.with_suffix(file_path.suffix + ".processing")
+def open_journal():
+    if not JOURNAL_DB:
+        return None
+    if JobJournal is None:
+        print("[Watcher] sqlite3 no disponible: journal desactivado")
+        return None
+    try:
+        return DbWorker(lambda: JobJournal(JOURNAL_DB, lease_seconds=LEASE_SECONDS), "journal")
+    except Exception as e:
+        print(f"[Watcher] No se pudo abrir el journal {JOURNAL_DB} ({e}); journal desactivado")
+        return None
+
+async def recover_orphans(journal):
+    requeued, cleaned = await journal.run("recover", QUEUE_DIR)
+    for name in requeued:
+        print(f"[Journal] Recovered orphan: {name}")
+    for name in cleaned:
+        print(f"[Journal] Cleaned finished: {name}")
+
+async def keep_lease(journal, names):
+    while True:
+        await asyncio.sleep(max(1.0, journal.obj.lease / 3))
+        for name in names:
+            await journal.run("renew", name)
+
+def processing_path_for(file_path: Path) -> Path:
+    return file_path.with_suffix(file_path.suffix + ".processing")
+
+async def claim_file(journal, file_path: Path) -> bool:
+    # Claim atómico para que no se procese doble (con journal: también entre procesos)
+    processing_path = processing_path_for(file_path)
+    if journal is not None:
+        return await journal.run("claim", file_path, processing_path)
     try:
         file_path.rename(processing_path)
     except Exception:
-        return
+        return False
+    return True
 
-    raw_logs = read_text(processing_path)
+async def rollback_file(journal, file_path: Path, detail: str):
+    # rollback del .processing si existe
+    proc = processing_path_for(file_path)
+    try:
+        if journal is not None:
+            await journal.run("release", file_path, proc, detail=detail[:500])
+        elif proc.exists():
+            proc.rename(file_path)
+    except Exception:
+        pass
 
-    human_prompt = render_prompt(human_tpl, raw_logs)
-    machine_prompt = render_prompt(machine_tpl, raw_logs)
+async def process_group(client: httpx.AsyncClient, journal, files, human_tpl, machine_tpl) -> list:
+    """Procesa uno o varios archivos (lote). Devuelve los que se procesaron aquí."""
+    claimed = [f for f in files if await claim_file(journal, f)]
+    if not claimed:
+        return []
 
-    # Si falla Ollama por cualquier razón, preferimos NO botar el watcher completo.
-    # Devolvemos strings de fallback para poder guardar algo y continuar.
-    async with httpx.AsyncClient() as client:
-        try:
-            t1 = asyncio.create_task(ollama_generate(client, MODEL_HUMAN, human_prompt))
-            t2 = asyncio.create_task(ollama_generate(client, MODEL_MACHINE, machine_prompt))
-            human_text, machine_text = await asyncio.gather(t1, t2)
-        except Exception as e:
-            # fallback duro: guarda el error como texto plano
-            human_text = f"[ERROR] OLLAMA_FAILED: {e}"
-            machine_text = f"[ERROR] OLLAMA_FAILED: {e}"
+    lease = None
+    if journal is not None:
+        for f in claimed:
+            await journal.run("started", f.name)
+        lease = asyncio.create_task(keep_lease(journal, [f.name for f in claimed]))
+    try:
+        if len(claimed) == 1:
+            await generate_outputs(client, claimed[0], processing_path_for(claimed[0]), human_tpl, machine_tpl)
+        else:
+            await generate_batch(client, claimed, human_tpl, machine_tpl)
+    except Exception as e:
+        # Esperar antes del rollback: el rename de vuelta genera un evento nuevo
+        # y no queremos reintentar en caliente.
+        await asyncio.sleep(POLL_SECONDS)
+        for f in claimed:
+            await rollback_file(journal, f, str(e))
+        raise
+    finally:
+        if lease is not None:
+            lease.cancel()
 
-    # ---- LIMPIEZA ANTES DE GUARDAR (TODO TXT PLANO) ----
-    human_text = strip_reserved(human_text)
-    machine_text = strip_reserved(machine_text)
+    for f in claimed:
+        # done antes de borrar: si morimos justo aquí, la recuperación solo limpia
+        if journal is not None:
+            await journal.run("done", f.name)
+        processing_path_for(f).unlink(missing_ok=True)
+    return claimed
 
-    original_name = file_path.name
+def write_outputs(original_name: str, human_text: str, machine_text: str):
+    # Textos ya limpios (strip_reserved): se escriben tal cual, TXT plano
     human_filename = f"human_{original_name}"
     machine_filename = f"log_{original_name}"
 
@@ -184,45 +820,393 @@ async def process_file(file_path: Path, human_tpl: str, machine_tpl: str):
     # si también quieres machine en message, descomenta:
     # write_text(OUT_MESSAGE_DIR / machine_filename, machine_text)
 
-    processing_path.unlink(missing_ok=True)
+def failed_text(e: Exception) -> str:
+    # fallback duro: guarda el error como texto plano
+    return strip_reserved(f"[ERROR] OLLAMA_FAILED: {e}")
+
+# -----------------------------
+# DEDUP
+# -----------------------------
+dedup_index = None  # DbWorker con el DedupIndex, abierto en main()
+
+def open_dedup():
+    if not DEDUP_DB or DedupIndex is None:
+        return None
+    try:
+        return DbWorker(lambda: DedupIndex(DEDUP_DB, max_bytes=DEDUP_MAX_BYTES, ttl=DEDUP_TTL_SECONDS), "dedup")
+    except Exception as e:
+        print(f"[Watcher] No se pudo abrir el índice de dedup {DEDUP_DB} ({e}); dedup desactivado")
+        return None
+
+def dedup_key(model: str, template, raw_logs: str, name: str):
+    if dedup_index is None:
+        return None
+    # Si la plantilla usa {{FILE_NAME}}, el nombre forma parte de la entrada
+    extra = name if "FILE_NAME" in template.names else ""
+    return DedupIndex.key(model, template.fingerprint(), raw_logs, extra)
+
+async def dedup_lookup(key, name: str, model: str):
+    if key is None:
+        return None
+    hit = await dedup_index.run("get", key)
+    if hit is not None:
+        print(f"[Dedup] Reused: {name} ({model})")
+    return hit
+
+# clave de dedup -> Future con la salida de la generación idéntica que ya está en vuelo
+# (se resuelve siempre: con el texto, o con None si el líder falló)
+inflight_by_key = {}
+
+async def dedup_wait(key, name: str, model: str):
+    """Si otra tarea ya genera esta misma entrada, espera su salida (None si no hay o falló)."""
+    fut = inflight_by_key.get(key) if key is not None else None
+    if fut is None:
+        return None
+    text = await asyncio.shield(fut)
+    if text is not None:
+        print(f"[Dedup] Reused: {name} ({model}, in flight)")
+    return text
+
+def dedup_lead(key):
+    """Marca la clave como en vuelo; None si no hay clave o ya la genera otra tarea."""
+    if key is None or key in inflight_by_key:
+        return None
+    fut = inflight_by_key[key] = asyncio.get_running_loop().create_future()
+    return fut
+
+def dedup_finish(key, lead, text):
+    if lead is not None:
+        inflight_by_key.pop(key, None)
+        lead.set_result(text)
+
+async def print_dedup_stats():
+    st = await dedup_index.run("stats")
+    print(f"[Dedup] hits={st['hits']} misses={st['misses']} stored={st['stores']} "
+          f"evicted={st['evictions']} entries={st['entries']} bytes={st['bytes']}")
+
+async def generate_clean(client: httpx.AsyncClient, model: str, template, raw_logs: str, name: str,
+                         lookup: bool = True) -> str:
+    """
+    Salida final (ya limpia) de un modelo para un archivo; usa y llena el índice de dedup.
+    Si la misma entrada ya se está generando en otra tarea, espera esa salida.
+    lookup=False: quien llama (un lote) ya consultó el índice y tiene la entrada en vuelo.
+    """
+    key = dedup_key(model, template, raw_logs, name)
+    lead = None
+    if lookup:
+        hit = await dedup_lookup(key, name, model)
+        if hit is None:
+            hit = await dedup_wait(key, name, model)
+        if hit is not None:
+            return hit
+        lead = dedup_lead(key)
+    text = None
+    try:
+        prompt = render_prompt(template, raw_logs, FILE_NAME=name, MODEL=model)
+        text = strip_reserved(await ollama_generate(client, model, prompt))
+        if key is not None:
+            await dedup_index.run("put", key, text)
+    finally:
+        dedup_finish(key, lead, text)
+    return text
+
+async def generate_outputs(client: httpx.AsyncClient, file_path: Path, processing_path: Path, human_tpl, machine_tpl):
+    raw_logs = read_text(processing_path)
+
+    if STREAM_MODE:
+        await process_stream(client, file_path.name, raw_logs, human_tpl, machine_tpl)
+        return
+
+    # Si falla Ollama por cualquier razón, preferimos NO botar el watcher completo.
+    # Devolvemos strings de fallback para poder guardar algo y continuar.
+    try:
+        t1 = asyncio.create_task(generate_clean(client, MODEL_HUMAN, human_tpl, raw_logs, file_path.name))
+        t2 = asyncio.create_task(generate_clean(client, MODEL_MACHINE, machine_tpl, raw_logs, file_path.name))
+        human_text, machine_text = await asyncio.gather(t1, t2)
+    except Exception as e:
+        human_text = machine_text = failed_text(e)
+
+    write_outputs(file_path.name, human_text, machine_text)
+
+async def process_stream(client: httpx.AsyncClient, name: str, raw_logs: str, human_tpl, machine_tpl):
+    # Mismos destinos que el modo normal (machine no va a message)
+    human_paths = [OUT_LOG_DIR / f"human_{name}", OUT_MESSAGE_DIR / f"human_{name}"]
+    machine_paths = [OUT_LOG_DIR / f"log_{name}"]
+
+    async def stream_one(model, template, paths):
+        key = dedup_key(model, template, raw_logs, name)
+        hit = await dedup_lookup(key, name, model)
+        if hit is None:
+            hit = await dedup_wait(key, name, model)
+        if hit is not None:
+            for path in paths:
+                write_text(path, hit)
+            return
+        lead = dedup_lead(key)
+        text = None
+        try:
+            prompt = render_prompt(template, raw_logs, FILE_NAME=name, MODEL=model)
+            await ollama_generate(client, model, prompt, paths)
+            # La salida ya está en disco y limpia: se lee para quien espera la misma
+            # entrada y se guarda en el índice (si cabe)
+            if key is not None:
+                text = read_text(paths[0])
+                if len(text) <= dedup_index.obj.max_bytes // 4:
+                    await dedup_index.run("put", key, text)
+        finally:
+            dedup_finish(key, lead, text)
+
+    t1 = asyncio.create_task(stream_one(MODEL_HUMAN, human_tpl, human_paths))
+    t2 = asyncio.create_task(stream_one(MODEL_MACHINE, machine_tpl, machine_paths))
+    try:
+        await asyncio.gather(t1, t2)
+    except Exception as e:
+        # la otra generación no debe seguir escribiendo encima del fallback
+        t1.cancel()
+        t2.cancel()
+        await asyncio.gather(t1, t2, return_exceptions=True)
+        for path in human_paths + machine_paths:
+            write_text(path, failed_text(e))
+
+# -----------------------------
+# BATCHING
+# -----------------------------
+BATCH_ENTRY = "<<<ENTRADA {n}: {name}>>>"
+BATCH_ANSWER_RE = re.compile(r"^[ \t]*<<<RESPUESTA (\d+)>>>[ \t]*$", re.MULTILINE)
+BATCH_INSTRUCTIONS = (
+    "IMPORTANTE: el texto de entrada contiene {count} registros independientes; cada uno "
+    "empieza con una línea <<<ENTRADA n: nombre>>>. Aplica las instrucciones anteriores a "
+    "cada registro por separado. Empieza la respuesta de cada registro con una línea que diga "
+    "exactamente <<<RESPUESTA n>>> (el mismo n, en orden) y no escribas nada fuera de esas secciones."
+)
+
+def split_batch_output(text: str, count: int):
+    """Parte la respuesta por <<<RESPUESTA n>>>; None si no vienen exactamente 1..count."""
+    marks = list(BATCH_ANSWER_RE.finditer(text or ""))
+    if [int(m.group(1)) for m in marks] != list(range(1, count + 1)):
+        return None
+    ends = [m.start() for m in marks[1:]] + [len(text)]
+    parts = [text[m.end():end].strip() for m, end in zip(marks, ends)]
+    if not all(parts):
+        return None
+    return parts
+
+async def generate_batch(client: httpx.AsyncClient, files, human_tpl, machine_tpl):
+    names = [f.name for f in files]
+    raws = [read_text(processing_path_for(f)) for f in files]
+
+    async def per_model(model, tpl):
+        results = [None] * len(files)
+        failed = set()  # índices con failed_text: no se comparten con otras tareas
+
+        async def single(i):
+            try:
+                # el lote ya consultó el índice para este archivo y lo tiene en vuelo
+                return await generate_clean(client, model, tpl, raws[i], names[i], lookup=False)
+            except Exception as e:
+                failed.add(i)
+                return failed_text(e)
+
+        keys = [dedup_key(model, tpl, raw, name) for name, raw in zip(names, raws)]
+        first = {}  # clave -> primer índice del lote con esa entrada
+        twins = []  # (copia, original): entradas idénticas dentro del mismo lote
+        for i, key in enumerate(keys):
+            if key is not None and key in first:
+                twins.append((i, first[key]))
+                continue
+            if key is not None:
+                first[key] = i
+            results[i] = await dedup_lookup(key, names[i], model)
+        twin_idx = {i for i, _ in twins}
+        todo = [i for i, r in enumerate(results) if r is None and i not in twin_idx]
+        # Entradas que otro worker ya está generando: esperar su salida en vez de repetirla
+        waiting = [i for i in todo if keys[i] in inflight_by_key]
+        if waiting:
+            texts = await asyncio.gather(*(dedup_wait(keys[i], names[i], model) for i in waiting))
+            for i, text in zip(waiting, texts):
+                results[i] = text
+            todo = [i for i in todo if results[i] is None]
+        leads = {i: dedup_lead(keys[i]) for i in todo}
+        try:
+            if len(todo) == 1:
+                results[todo[0]] = await single(todo[0])
+            elif todo:
+                joined = "\n\n".join(
+                    f"{BATCH_ENTRY.format(n=n, name=names[i])}\n{raws[i]}" for n, i in enumerate(todo, 1)
+                )
+                prompt = render_prompt(tpl, joined, FILE_NAME=", ".join(names[i] for i in todo), MODEL=model)
+                prompt += "\n\n" + BATCH_INSTRUCTIONS.format(count=len(todo))
+                print(f"[Batch] {model}: {len(todo)} files -> one prompt")
+                try:
+                    parts = split_batch_output(await ollama_generate(client, model, prompt), len(todo))
+                except Exception as e:
+                    parts = None
+                    for i in todo:
+                        results[i] = failed_text(e)
+                        failed.add(i)
+                if parts is not None:
+                    for i, part in zip(todo, parts):
+                        results[i] = strip_reserved(part)
+                        if keys[i] is not None:
+                            await dedup_index.run("put", keys[i], results[i])
+                elif not failed:
+                    # El modelo no respetó los separadores: archivo por archivo
+                    print(f"[Batch] {model}: respuesta sin las {len(todo)} secciones, fallback por archivo")
+                    parts = await asyncio.gather(*(single(i) for i in todo))
+                    for i, text in zip(todo, parts):
+                        results[i] = text
+        finally:
+            for i, lead in leads.items():
+                dedup_finish(keys[i], lead, None if i in failed else results[i])
+        for i, j in twins:
+            print(f"[Dedup] Reused: {names[i]} ({model}, same batch as {names[j]})")
+            results[i] = results[j]
+        return results
+
+    human_parts, machine_parts = await asyncio.gather(
+        per_model(MODEL_HUMAN, human_tpl), per_model(MODEL_MACHINE, machine_tpl)
+    )
+    for name, human_text, machine_text in zip(names, human_parts, machine_parts):
+        write_outputs(name, human_text, machine_text)
+
+async def batcher(inbox: asyncio.Queue, jobs: asyncio.Queue):
+    """
+    Agrupa archivos pequeños: el lote se cierra al llegar a BATCH_MAX_FILES o
+    BATCH_MAX_BYTES, o cuando pasan BATCH_WINDOW_SECONDS desde el primero.
+    """
+    loop = asyncio.get_running_loop()
+    carry = None
+    while True:
+        f, size, human_tpl, machine_tpl = carry or await inbox.get()
+        carry = None
+        group, total = [f], size
+        deadline = loop.time() + BATCH_WINDOW_SECONDS
+        while len(group) < BATCH_MAX_FILES:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(inbox.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            # plantillas recargadas o lote lleno: el archivo abre el siguiente lote
+            if item[2] is not human_tpl or item[3] is not machine_tpl or total + item[1] > BATCH_MAX_BYTES:
+                carry = item
+                break
+            group.append(item[0])
+            total += item[1]
+        await jobs.put((group, human_tpl, machine_tpl))
+
+async def worker(client: httpx.AsyncClient, journal, jobs: asyncio.Queue, in_progress: set):
+    while True:
+        files, human_tpl, machine_tpl = await jobs.get()
+        try:
+            for f in await process_group(client, journal, files, human_tpl, machine_tpl):
+                print(f"[OK] Processed: {f.name}")
+        except Exception as e:
+            print(f"[ERROR] Failed: {', '.join(f.name for f in files)} -> {e}")
+        finally:
+            for f in files:
+                in_progress.discard(f.name)
+            jobs.task_done()
 
 async def main():
+    global dedup_index
     safe_mkdirs()
+    source = QueueSource(QUEUE_DIR)
+    source.start()
+    prompts = PromptStore(PROMPT_DIR)
+    prompts.start()
+    journal = open_journal()
+    dedup_index = open_dedup()
 
     print(f"[Watcher] Queue: {QUEUE_DIR}")
     print(f"[Watcher] Prompts: {PROMPT_DIR}")
     print(f"[Watcher] Output log: {OUT_LOG_DIR}")
     print(f"[Watcher] Output message: {OUT_MESSAGE_DIR}")
-    print(f"[Watcher] Poll every {POLL_SECONDS}s")
+    if source.mode == "inotify":
+        print(f"[Watcher] Mode: inotify (rescan every {RESCAN_SECONDS}s)")
+    else:
+        print(f"[Watcher] Poll every {POLL_SECONDS}s")
+    limits = ", ".join(f"{m}={n}" for m, n in MODEL_CONCURRENCY.items())
+    print(f"[Watcher] Workers: {WORKERS} | Per-model limits: {limits}")
+    if STREAM_MODE:
+        print("[Watcher] Streaming output enabled")
+    batching = BATCH_MODE and not STREAM_MODE  # el streaming escribe por archivo: no se combina
+    if batching:
+        print(f"[Watcher] Batching: window {BATCH_WINDOW_SECONDS}s, max {BATCH_MAX_FILES} files / "
+              f"{BATCH_MAX_BYTES} bytes, files < {BATCH_FILE_MAX_BYTES} bytes")
+    elif BATCH_MODE:
+        print("[Watcher] Batching ignored in streaming mode")
+    if journal is not None:
+        print(f"[Watcher] Journal: {JOURNAL_DB} (owner {journal.obj.owner}, lease {LEASE_SECONDS}s)")
+        await recover_orphans(journal)
+    if dedup_index is not None:
+        st = await dedup_index.run("stats")
+        print(f"[Watcher] Dedup: {DEDUP_DB} ({st['entries']} entries, {st['bytes']} bytes)")
     print("[Watcher] Running. Stop with CTRL+C.\n")
 
-    while True:
-        try:
-            human_tpl, machine_tpl = load_prompts()
-        except FileNotFoundError:
-            print("[ERROR] Prompt files not found. Create:")
-            print(f" - {HUMAN_PROMPT_FILE}")
-            print(f" - {MACHINE_PROMPT_FILE}")
-            time.sleep(POLL_SECONDS)
-            continue
-
-        files = list_txt_files()
-        if files:
+    # Cola acotada: si los workers van atrasados, el productor espera (backpressure)
+    jobs = asyncio.Queue(maxsize=max(1, JOB_QUEUE_SIZE))
+    in_progress = set()  # nombres encolados o en proceso (eventos + rescan pueden repetirlos)
+    client = make_http_client()
+    workers = [asyncio.create_task(worker(client, journal, jobs, in_progress)) for _ in range(max(1, WORKERS))]
+    inbox = None
+    if batching:
+        inbox = asyncio.Queue(maxsize=max(1, JOB_QUEUE_SIZE) * max(1, BATCH_MAX_FILES))
+        workers.append(asyncio.create_task(batcher(inbox, jobs)))
+    last_recover = time.monotonic()
+    last_dedup = (0, 0)
+
+    try:
+        while True:
+            batch = await source.next_batch()
+            if time.monotonic() - last_recover >= RESCAN_SECONDS:
+                last_recover = time.monotonic()
+                if journal is not None:
+                    # huérfanos de otros watchers que murieron (su lease ya caducó)
+                    await recover_orphans(journal)
+                if dedup_index is not None and (dedup_index.obj.hits, dedup_index.obj.misses) != last_dedup:
+                    last_dedup = (dedup_index.obj.hits, dedup_index.obj.misses)
+                    await print_dedup_stats()
+            files = [f for f in batch if f.name not in in_progress]
+            if not files:
+                continue
+
+            try:
+                human_tpl, machine_tpl = load_prompts(prompts)
+            except FileNotFoundError:
+                print("[ERROR] Prompt files not found. Create:")
+                print(f" - {prompts.path_for(HUMAN_PROMPT)}")
+                print(f" - {prompts.path_for(MACHINE_PROMPT)}")
+                source.request_rescan()
+                await asyncio.sleep(POLL_SECONDS)
+                continue
+
             for f in files:
-                try:
-                    await process_file(f, human_tpl, machine_tpl)
-                    print(f"[OK] Processed: {f.name}")
-                except Exception as e:
-                    # rollback del .processing si existe
-                    proc = f.with_suffix(f.suffix + ".processing")
-                    if proc.exists():
-                        try:
-                            proc.rename(f)
-                        except Exception:
-                            pass
-                    print(f"[ERROR] Failed: {f.name} -> {e}")
-
-        time.sleep(POLL_SECONDS)
+                in_progress.add(f.name)
+                if inbox is not None:
+                    try:
+                        size = f.stat().st_size
+                    except OSError:
+                        size = BATCH_FILE_MAX_BYTES
+                    if size < BATCH_FILE_MAX_BYTES:
+                        await inbox.put((f, size, human_tpl, machine_tpl))
+                        continue
+                await jobs.put(([f], human_tpl, machine_tpl))
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await client.aclose()
+        prompts.close()
+        source.close()
+        if journal is not None:
+            journal.close()
+        if dedup_index is not None:
+            await print_dedup_stats()
+            dedup_index.close()
+            dedup_index = None
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,107 @@
+# watcher_dedup.py
+"""
+Índice de deduplicación de queue_watcher (SQLite en modo WAL).
+
+Si llega a la cola una entrada idéntica a una ya procesada (reintentos de n8n,
+respuestas repetidas), se reutiliza la salida guardada en vez de volver a llamar a
+Ollama. La clave es sha256(modelo + huella de la plantilla + raw_logs): si cambia el
+prompt o el modelo, no hay hit.
+
+- Se guarda la salida final (ya pasada por strip_reserved), tal como se escribe.
+- Caducidad por edad (ttl) y tope total en bytes (se expulsan las menos usadas).
+- Contadores de hits/misses/guardados/expulsiones para el log del watcher.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+
+class DedupIndex:
+    def __init__(self, db_path, max_bytes=64 * 1024 * 1024, ttl=7 * 86400.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            " key TEXT PRIMARY KEY, output TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS outputs_used ON outputs(used_at)")
+        self._evict()
+
+    @staticmethod
+    def key(model: str, template_fingerprint: str, raw_logs: str, extra: str = "") -> str:
+        h = hashlib.sha256()
+        for part in (model, template_fingerprint, extra):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        h.update(raw_logs.encode("utf-8", errors="replace"))
+        return h.hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        row = self.db.execute(
+            "SELECT output, created_at FROM outputs WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and self.ttl and row[1] <= now - self.ttl:
+            self.db.execute("DELETE FROM outputs WHERE key = ?", (key,))
+            self.evictions += 1
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE outputs SET used_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, output: str):
+        size = len(output.encode("utf-8", errors="replace"))
+        # una sola salida enorme no debe vaciar el índice entero
+        if size > self.max_bytes // 4:
+            return
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO outputs(key, output, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)",
+            (key, output, size, now, now),
+        )
+        self.stores += 1
+        self._evict()
+
+    def _evict(self):
+        if self.ttl:
+            cur = self.db.execute("DELETE FROM outputs WHERE created_at <= ?", (time.time() - self.ttl,))
+            self.evictions += max(cur.rowcount, 0)
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM outputs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Menos usadas primero hasta bajar del tope
+        for key, size in self.db.execute("SELECT key, size FROM outputs ORDER BY used_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM outputs WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        entries, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outputs").fetchone()
+        return {
+            "entries": entries,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,195 @@
+# watcher_journal.py
+"""
+Journal de trabajos de queue_watcher (SQLite en modo WAL).
+
+Cada archivo de la cola pasa por claimed -> started -> done (o released si falla).
+Cada transición queda además en la tabla `events` (solo se añade, nunca se edita).
+
+- Claim: dentro de una transacción BEGIN IMMEDIATE se comprueba que nadie tenga el
+  archivo con lease vigente y se renombra a .processing. Varios watchers (procesos o
+  contenedores) pueden compartir la misma cola y la misma base de datos sin procesar
+  dos veces el mismo archivo.
+- Lease: el dueño ("host:pid:token") la renueva mientras trabaja. Si el proceso muere,
+  la lease caduca y cualquier watcher recupera el .processing huérfano.
+- done se registra DESPUÉS de escribir las salidas: si el proceso muere entre eso y
+  borrar el .processing, la recuperación solo limpia (no se vuelve a generar).
+"""
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+CLAIMED = "claimed"
+STARTED = "started"
+DONE = "done"
+RELEASED = "released"
+
+PROCESSING_SUFFIX = ".processing"
+
+
+def owner_id() -> str:
+    # El token distingue reinicios del mismo contenedor (mismo hostname y mismo pid)
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobJournal:
+    def __init__(self, db_path, lease_seconds=60.0, keep_days=7.0, owner=None):
+        self.lease = lease_seconds
+        self.owner = owner or owner_id()
+        self.host, pid, _ = self.owner.rsplit(":", 2)
+        self.pid = int(pid)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # isolation_level=None: las transacciones se abren a mano con BEGIN IMMEDIATE
+        self.db = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " name TEXT PRIMARY KEY, state TEXT NOT NULL, owner TEXT NOT NULL,"
+            " lease_until REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, at REAL NOT NULL, name TEXT NOT NULL,"
+            " state TEXT NOT NULL, owner TEXT NOT NULL, detail TEXT)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_at ON events(at)")
+        if keep_days:
+            cutoff = time.time() - keep_days * 86400
+            with self._tx():
+                self.db.execute("DELETE FROM events WHERE at < ?", (cutoff,))
+                self.db.execute("DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?", (DONE, RELEASED, cutoff))
+
+    # ---------- transacciones ----------
+    @contextmanager
+    def _tx(self):
+        self.db.execute("BEGIN IMMEDIATE")  # toma el lock de escritura ya: claims serializados
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        else:
+            self.db.execute("COMMIT")
+
+    def _row(self, name):
+        return self.db.execute(
+            "SELECT state, owner, lease_until FROM jobs WHERE name = ?", (name,)
+        ).fetchone()
+
+    def _record(self, name, state, lease_until, detail=None, attempt=False):
+        now = time.time()
+        self.db.execute(
+            "INSERT INTO jobs(name, state, owner, lease_until, attempts, updated_at) VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET state = excluded.state, owner = excluded.owner,"
+            " lease_until = excluded.lease_until, attempts = jobs.attempts + ?, updated_at = excluded.updated_at",
+            (name, state, self.owner, lease_until, 1 if attempt else 0, now, 1 if attempt else 0),
+        )
+        self.db.execute(
+            "INSERT INTO events(at, name, state, owner, detail) VALUES (?, ?, ?, ?, ?)",
+            (now, name, state, self.owner, detail),
+        )
+
+    def _expired(self, owner, lease_until, now) -> bool:
+        if lease_until <= now:
+            return True
+        try:
+            host, pid, _ = owner.rsplit(":", 2)
+            pid = int(pid)
+        except ValueError:
+            return False
+        if owner == self.owner or host != self.host:
+            return False
+        # Mismo host: si el pid ya no existe (o es el nuestro con otro token, es decir,
+        # una vida anterior de este proceso) no hace falta esperar a que caduque la lease.
+        return pid == self.pid or not pid_alive(pid)
+
+    # ---------- ciclo de vida ----------
+    def claim(self, file_path: Path, processing_path: Path) -> bool:
+        """Reclama el archivo y lo renombra a .processing. False si otro lo tiene."""
+        name = file_path.name
+        now = time.time()
+        with self._tx():
+            row = self._row(name)
+            if row and row[0] in (CLAIMED, STARTED) and not self._expired(row[1], row[2], now):
+                return False
+            try:
+                file_path.rename(processing_path)
+            except OSError:
+                return False
+            self._record(name, CLAIMED, now + self.lease, attempt=True)
+        return True
+
+    def started(self, name):
+        with self._tx():
+            self._record(name, STARTED, time.time() + self.lease)
+
+    def renew(self, name):
+        self.db.execute(
+            "UPDATE jobs SET lease_until = ? WHERE name = ? AND owner = ? AND state IN (?, ?)",
+            (time.time() + self.lease, name, self.owner, CLAIMED, STARTED),
+        )
+
+    def done(self, name):
+        with self._tx():
+            self._record(name, DONE, 0.0)
+
+    def release(self, file_path: Path, processing_path: Path, detail=None):
+        """Fallo: devuelve el .processing a la cola para reintentarlo."""
+        with self._tx():
+            if processing_path.exists() and not file_path.exists():
+                processing_path.rename(file_path)
+            self._record(file_path.name, RELEASED, 0.0, detail=detail)
+
+    # ---------- recuperación ----------
+    def recover(self, queue_dir: Path):
+        """
+        Revisa los .processing de la cola. Devuelve (reencolados, limpiados):
+        - done: las salidas ya están escritas, solo falta borrar el .processing.
+        - sin registro o con lease caducada: el dueño murió; vuelve a la cola.
+        """
+        requeued, cleaned = [], []
+        for proc in queue_dir.glob("*" + PROCESSING_SUFFIX):
+            name = proc.name[: -len(PROCESSING_SUFFIX)]
+            target = proc.with_name(name)
+            with self._tx():
+                row = self._row(name)
+                if row and row[0] == DONE:
+                    proc.unlink(missing_ok=True)
+                    cleaned.append(name)
+                    continue
+                if row and row[0] in (CLAIMED, STARTED) and not self._expired(row[1], row[2], time.time()):
+                    continue
+                if target.exists():
+                    continue  # llegó un archivo nuevo con el mismo nombre: no pisarlo
+                try:
+                    proc.rename(target)
+                except FileNotFoundError:
+                    continue
+                self._record(name, RELEASED, 0.0, detail="recovered")
+                requeued.append(name)
+        return requeued, cleaned
+
+    def stats(self):
+        rows = self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None